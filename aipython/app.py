@@ -1,19 +1,64 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, has_request_context, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring, UpdateOne, ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 from bson.objectid import ObjectId
+import bson
+import gridfs
+from bson.decimal128 import Decimal128
+from bson.timestamp import Timestamp
+import base64
+import gzip
+import hashlib
 import os
 import datetime
 import re
 from dotenv import load_dotenv
+import click
 import nltk
-import ssl
+from nltk.stem import PorterStemmer
+from nltk.tokenize.punkt import PunktTokenizer
 import json
 import random
 import string
 import logging
+import threading
+import zlib
+import zipfile
+import io
+import mmap
+import math
+import struct
+import functools
+import heapq
+from array import array
+import sys
+import time
+from collections import deque, OrderedDict
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    # Fall back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    # Responses are only gzip-compressed without brotli
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    # Avatars are served without thumbnails when Pillow is missing
+    Image = None
 
 # Load environment variables
 load_dotenv()
@@ -24,16 +69,9 @@ os.makedirs(nltk_data_dir, exist_ok=True)
 nltk.data.path.append(nltk_data_dir)
 
 try:
-    # Try to disable SSL verification for NLTK downloads
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = _create_unverified_https_context
-    
-    # Download required NLTK data
-    for package in ['punkt', 'stopwords', 'vader_lexicon']:
+    # Download required NLTK data over verified TLS; punkt_tab replaces the
+    # pickled punkt models, which nltk no longer loads safely
+    for package in ['punkt_tab', 'stopwords', 'vader_lexicon', 'words']:
         try:
             nltk.download(package, download_dir=nltk_data_dir, quiet=True)
         except Exception as e:
@@ -42,17 +80,210 @@ try:
 except Exception as e:
     pass
 
+def isoformat_utc(value):
+    """ISO 8601 with a Z suffix for UTC; naive datetimes are UTC, as pymongo returns them"""
+    if isinstance(value, datetime.datetime) and (
+        value.tzinfo is None or value.utcoffset() == datetime.timedelta(0)
+    ):
+        return value.replace(tzinfo=None).isoformat() + 'Z'
+    return value.isoformat()
+
+def json_default(obj):
+    """Encode MongoDB/BSON types that the JSON encoders don't handle natively"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return isoformat_utc(obj)
+    if isinstance(obj, Timestamp):
+        return isoformat_utc(obj.as_datetime())
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('ascii')
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Datetimes are written as UTC with a "Z" suffix so browsers don't read them as local time
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z) if orjson else 0
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes ObjectId, datetime and BSON types natively,
+    using orjson when it is installed
+    """
+    sort_keys = False
+
+    @staticmethod
+    def default(obj):
+        return json_default(obj)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def dumps_bytes(self, obj):
+        """Serialize a single compact JSON document to UTF-8 bytes"""
+        if orjson is None:
+            return json.dumps(obj, default=json_default, separators=(",", ":")).encode('utf-8')
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = ORJSON_OPTIONS
+        if self._app.debug:
+            option |= orjson.OPT_INDENT_2
+        # Hand the encoded bytes straight to the response without a str round trip
+        return self._app.response_class(
+            orjson.dumps(obj, default=json_default, option=option) + b"\n",
+            mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
-CORS(app)
+app.json_provider_class = FastJSONProvider
+app.json = FastJSONProvider(app)
+CORS(app, expose_headers=['ETag', 'Retry-After'])
 
 # Configure JWT
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET')  # Use the JWT secret from .env
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = datetime.timedelta(days=1)
 jwt = JWTManager(app)
 
+# Hard cap on request bodies, enforced by Werkzeug while reading, so chunked or
+# mislabelled uploads can't be spooled to disk without limit
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+
+@app.before_request
+def reject_large_bodies():
+    """Refuse bodies over the cap from their Content-Length, before any view reads them"""
+    if request.content_length and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({"message": "Request body is too large"}), 413
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"message": "Request body is too large"}), 413
+
+# MongoDB command monitoring
+MONGO_SLOW_QUERY_MS = float(os.environ.get('MONGO_SLOW_QUERY_MS', 100))
+MONGO_SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('MONGO_SLOW_QUERY_SAMPLE_RATE', 1.0))
+
+def query_shape(value):
+    """Replace literal values in a query with placeholders so queries group by shape"""
+    if isinstance(value, dict):
+        return {key: query_shape(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [query_shape(val) for val in value[:1]]
+    return "?"
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Records per-collection, per-command latency and documents returned, and
+    writes a sampled slow-query log tagged with the issuing route. Reply size is
+    only measured for logged slow queries, since re-encoding every reply would
+    double the BSON cost of large reads.
+    """
+    ignored_commands = {'hello', 'ismaster', 'isMaster', 'ping', 'buildinfo', 'buildInfo',
+                        'saslStart', 'saslContinue', 'endSessions', 'getLastError'}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.stats = {}
+
+    def started(self, event):
+        if event.command_name in self.ignored_commands:
+            return
+        command = event.command
+        if event.command_name == 'getMore':
+            collection = command.get('collection')
+        else:
+            collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.database_name
+
+        # Keep the query filter so slow queries can be logged by shape
+        if 'filter' in command:
+            query = command['filter']
+        elif 'pipeline' in command:
+            query = command['pipeline']
+        elif command.get('updates'):
+            query = command['updates'][0].get('q')
+        elif command.get('deletes'):
+            query = command['deletes'][0].get('q')
+        else:
+            query = None
+
+        route = request.endpoint if has_request_context() else None
+        with self.lock:
+            self.pending[(event.request_id, event.connection_id)] = (collection, route, query)
+
+    def succeeded(self, event):
+        self.record(event, failed=False)
+
+    def failed(self, event):
+        self.record(event, failed=True)
+
+    def record(self, event, failed):
+        with self.lock:
+            started = self.pending.pop((event.request_id, event.connection_id), None)
+        if started is None:
+            return
+        collection, route, query = started
+        duration_ms = event.duration_micros / 1000.0
+
+        documents = 0
+        if not failed:
+            reply = event.reply
+            cursor = reply.get('cursor')
+            if isinstance(cursor, dict):
+                documents = len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+            elif 'n' in reply:
+                documents = reply['n']
+
+        slow = duration_ms >= MONGO_SLOW_QUERY_MS and random.random() < MONGO_SLOW_QUERY_SAMPLE_RATE
+        reply_bytes = len(bson.encode(event.reply)) if slow and not failed else 0
+
+        key = f"{collection}.{event.command_name}"
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = {
+                    "count": 0, "failures": 0, "totalMs": 0.0, "maxMs": 0.0,
+                    "documents": 0, "slowQueries": 0, "slowBytes": 0
+                }
+            entry["count"] += 1
+            entry["failures"] += int(failed)
+            entry["totalMs"] += duration_ms
+            entry["maxMs"] = max(entry["maxMs"], duration_ms)
+            entry["documents"] += documents
+            entry["slowQueries"] += int(slow)
+            entry["slowBytes"] += reply_bytes
+
+        if slow:
+            slow_query_logger.warning(
+                f"Slow query: {key} took {duration_ms:.1f}ms route={route} "
+                f"documents={documents} bytes={reply_bytes} shape={json.dumps(query_shape(query))}"
+            )
+
+    def snapshot(self):
+        """Return a copy of the collected stats with average latency"""
+        with self.lock:
+            stats = {key: dict(entry) for key, entry in self.stats.items()}
+        for entry in stats.values():
+            entry["avgMs"] = entry["totalMs"] / entry["count"] if entry["count"] else 0.0
+        return stats
+
+mongo_metrics = MongoCommandMetrics()
+
 # Connect to MongoDB
 mongo_uri = os.environ.get('MONGODB_URI')  # Use the MongoDB URI from .env
-client = MongoClient(mongo_uri)
+client = MongoClient(mongo_uri, event_listeners=[mongo_metrics])
 db = client.get_database()
 
 import logging
@@ -76,29 +307,32 @@ logger = logging.getLogger("main")
 logger.setLevel(logging.INFO)  # Your app logs at INFO, but Werkzeug is quieter
 logger.propagate = False  # Ensure no propagation to other handlers
 
+# Slow MongoDB queries go through the root console handler
+slow_query_logger = logging.getLogger("mongo.slow")
+
 
 
+# Positive and negative word lists for the simple sentiment analyzer
+positive_words = [
+    'happy', 'good', 'great', 'excellent', 'wonderful', 'amazing', 'love', 'enjoy',
+    'pleased', 'delighted', 'glad', 'thankful', 'grateful', 'excited', 'hopeful',
+    'better', 'positive', 'calm', 'relaxed', 'peaceful', 'confident'
+]
+
+negative_words = [
+    'sad', 'bad', 'terrible', 'awful', 'horrible', 'hate', 'dislike', 'angry',
+    'upset', 'disappointed', 'frustrated', 'annoyed', 'worried', 'anxious', 'stressed',
+    'depressed', 'unhappy', 'miserable', 'lonely', 'afraid', 'scared', 'hopeless',
+    'worthless', 'tired', 'exhausted', 'pain', 'hurt', 'sick', 'worse', 'negative'
+]
+
 # Initialize simple sentiment analyzer
 def simple_sentiment_analysis(text):
     """
     A simple rule-based sentiment analyzer that doesn't rely on NLTK
     """
-    # Convert to lowercase
-    text = text.lower()
-    
-    # Define positive and negative word lists
-    positive_words = [
-        'happy', 'good', 'great', 'excellent', 'wonderful', 'amazing', 'love', 'enjoy',
-        'pleased', 'delighted', 'glad', 'thankful', 'grateful', 'excited', 'hopeful',
-        'better', 'positive', 'calm', 'relaxed', 'peaceful', 'confident'
-    ]
-    
-    negative_words = [
-        'sad', 'bad', 'terrible', 'awful', 'horrible', 'hate', 'dislike', 'angry',
-        'upset', 'disappointed', 'frustrated', 'annoyed', 'worried', 'anxious', 'stressed',
-        'depressed', 'unhappy', 'miserable', 'lonely', 'afraid', 'scared', 'hopeless',
-        'worthless', 'tired', 'exhausted', 'pain', 'hurt', 'sick', 'worse', 'negative'
-    ]
+    # Convert to lowercase and fix misspelled vocabulary words
+    text = correct_misspellings(text.lower())
     
     # Count occurrences
     positive_count = sum(1 for word in positive_words if re.search(r'\b' + word + r'\b', text))
@@ -123,71 +357,279 @@ def simple_sentiment_analysis(text):
         'neutral_score': 1 - (positive_count + negative_count) / (len(text.split()) + 1)
     }
 
-# Simple keyword extraction
-def extract_keywords(text, max_keywords=10):
+# VADER-style sentiment analysis backed by the bundled vader_lexicon
+SENTIMENT_MODE = os.environ.get('SENTIMENT_MODE', 'simple')
+vader_lexicon_zip = os.path.join(nltk_data_dir, 'sentiment', 'vader_lexicon.zip')
+vader_lexicon_bin = os.path.join(nltk_data_dir, 'sentiment', 'vader_lexicon.bin')
+VADER_MAGIC = b'VDRLEX01'
+VADER_HEADER = struct.Struct('<8sI')
+
+vader_booster_words = {
+    'absolutely': 0.293, 'amazingly': 0.293, 'completely': 0.293, 'deeply': 0.293,
+    'especially': 0.293, 'extremely': 0.293, 'hugely': 0.293, 'incredibly': 0.293,
+    'particularly': 0.293, 'quite': 0.293, 'really': 0.293, 'so': 0.293,
+    'totally': 0.293, 'truly': 0.293, 'very': 0.293, 'super': 0.293,
+    'barely': -0.293, 'hardly': -0.293, 'slightly': -0.293, 'somewhat': -0.293,
+    'marginally': -0.293, 'little': -0.293, 'partly': -0.293
+}
+
+vader_negations = {
+    'not', 'no', 'never', 'none', 'nothing', 'nowhere', 'neither', 'nor',
+    'cannot', 'without', 'nobody', 'rarely', 'seldom', 'despite'
+}
+
+def build_vader_lexicon(source, target):
     """
-    Extract keywords from text without using NLTK
+    Convert vader_lexicon.txt into a sorted binary artifact: a header, a uint32
+    offset table, a float32 valence table and the concatenated UTF-8 words
+    """
+    entries = {}
+    with zipfile.ZipFile(source) as archive:
+        with archive.open('vader_lexicon/vader_lexicon.txt') as f:
+            for line in io.TextIOWrapper(f, encoding='utf-8'):
+                parts = line.strip().split('\t')
+                if len(parts) >= 2:
+                    entries[parts[0].encode('utf-8')] = float(parts[1])
+
+    words = sorted(entries)
+    offsets = array('I')
+    blob = bytearray()
+    for word in words:
+        offsets.append(len(blob))
+        blob += word
+    offsets.append(len(blob))
+    valences = array('f', (entries[word] for word in words))
+
+    # Write to a temporary file first so concurrent workers never see a partial artifact
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(VADER_HEADER.pack(VADER_MAGIC, len(words)))
+        f.write(offsets.tobytes())
+        f.write(valences.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, target)
+
+class VaderLexicon:
+    """Memory-mapped, read-only view of the binary VADER lexicon"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = VADER_HEADER.unpack_from(self.mm, 0)
+        if magic != VADER_MAGIC:
+            raise ValueError(f"{path} is not a VADER lexicon artifact")
+        view = memoryview(self.mm)
+        start = VADER_HEADER.size
+        self.offsets = view[start:start + 4 * (self.size + 1)].cast('I')
+        start += 4 * (self.size + 1)
+        self.valences = view[start:start + 4 * self.size].cast('f')
+        self.words_start = start + 4 * self.size
+        self.get = functools.lru_cache(maxsize=8192)(self.lookup)
+
+    def word_at(self, index):
+        return self.mm[self.words_start + self.offsets[index]:self.words_start + self.offsets[index + 1]]
+
+    def lookup(self, word):
+        """Binary search for a word, returning its valence or None"""
+        key = word.encode('utf-8')
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if self.word_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.size and self.word_at(low) == key:
+            return self.valences[low]
+        return None
+
+vader_lexicon = None
+vader_lexicon_lock = threading.Lock()
+
+def load_vader_lexicon():
+    """Build the binary lexicon once if needed and map it into memory"""
+    global vader_lexicon
+    if vader_lexicon is not None:
+        return vader_lexicon
+    with vader_lexicon_lock:
+        if vader_lexicon is None:
+            try:
+                if not os.path.exists(vader_lexicon_bin) or (
+                    os.path.exists(vader_lexicon_zip)
+                    and os.path.getmtime(vader_lexicon_zip) > os.path.getmtime(vader_lexicon_bin)
+                ):
+                    build_vader_lexicon(vader_lexicon_zip, vader_lexicon_bin)
+                vader_lexicon = VaderLexicon(vader_lexicon_bin)
+            except Exception as e:
+                logger.warning(f"VADER lexicon unavailable, using simple sentiment: {str(e)}")
+                vader_lexicon = False
+    return vader_lexicon
+
+def vader_sentiment_analysis(text):
+    """
+    A VADER-style sentiment analyzer using the bundled lexicon with booster
+    words, negation, "but" shifts and emphasis; returns the same schema as
+    simple_sentiment_analysis
+    """
+    lexicon = load_vader_lexicon()
+    if not lexicon:
+        return simple_sentiment_analysis(text)
+    return lexicon_sentiment_analysis(text, lexicon)
+
+def lexicon_sentiment_analysis(text, lexicon):
+    """Score text VADER-style against any lexicon with a get(word) -> valence method"""
+    raw_tokens = text.split()
+    all_caps = text.isupper()
+    tokens = []
+    for token in raw_tokens:
+        # Keep emoticons like ":)" intact, otherwise strip surrounding punctuation
+        if lexicon.get(token.lower()) is None:
+            token = token.strip(string.punctuation) or token
+        tokens.append(token)
+    lowered = [token.lower() for token in tokens]
+
+    valences = []
+    for i, word in enumerate(lowered):
+        valence = lexicon.get(word)
+        if valence is None or word in vader_booster_words:
+            valences.append(0.0)
+            continue
+
+        # Emphasis from capitalisation when the rest of the text isn't shouted
+        if tokens[i].isupper() and not all_caps:
+            valence += 0.733 if valence > 0 else -0.733
+
+        # Boosters and negations in the three preceding words
+        for distance in range(1, 4):
+            if i - distance < 0:
+                break
+            previous = lowered[i - distance]
+            scale = (1.0, 0.95, 0.9)[distance - 1]
+            if previous in vader_booster_words:
+                boost = vader_booster_words[previous] * scale
+                valence += boost if valence > 0 else -boost
+            if previous in vader_negations or previous.endswith("n't"):
+                valence *= -0.74
+        valences.append(valence)
+
+    # Words after "but" carry more weight than those before it
+    if 'but' in lowered:
+        but_index = lowered.index('but')
+        valences = [
+            valence * 0.5 if i < but_index else valence * 1.5 if i > but_index else valence
+            for i, valence in enumerate(valences)
+        ]
+
+    total = sum(valences)
+    if total:
+        emphasis = min(text.count('!'), 4) * 0.292
+        total += emphasis if total > 0 else -emphasis
+    compound_score = total / math.sqrt(total * total + 15)
+
+    positive_sum = sum(valence + 1 for valence in valences if valence > 0)
+    negative_sum = sum(valence - 1 for valence in valences if valence < 0)
+    neutral_count = sum(1 for valence in valences if valence == 0)
+    denominator = positive_sum + abs(negative_sum) + neutral_count
+
+    if compound_score >= 0.05:
+        sentiment = 'positive'
+    elif compound_score <= -0.05:
+        sentiment = 'negative'
+    else:
+        sentiment = 'neutral'
+
+    return {
+        'sentiment': sentiment,
+        'compound_score': compound_score,
+        'positive_score': positive_sum / denominator if denominator else 0.0,
+        'negative_score': abs(negative_sum) / denominator if denominator else 0.0,
+        'neutral_score': neutral_count / denominator if denominator else 1.0
+    }
+
+def sentiment_analysis(text, mode=None, language='english'):
+    """Run the configured sentiment analyzer ('simple' or 'vader')"""
+    if language != 'english':
+        lexicon = language_resources.get(language)['lexicon']
+        if lexicon:
+            return lexicon_sentiment_analysis(text, lexicon)
+    if (mode or SENTIMENT_MODE) == 'vader':
+        return vader_sentiment_analysis(text)
+    return simple_sentiment_analysis(text)
+
+# Common English stop words ignored by keyword extraction
+stop_words = {
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'your', 
+    'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 
+    'her', 'hers', 'herself', 'it', 'its', 'itself', 'they', 'them', 'their', 
+    'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', 
+    'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 
+    'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 
+    'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 
+    'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 
+    'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 
+    'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 
+    'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 
+    'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 
+    'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 
+    't', 'can', 'will', 'just', 'don', 'should', 'now'
+}
+
+def count_keywords(text, language='english'):
+    """
+    Count keyword frequencies in text, ignoring stop words
     """
     # Convert to lowercase and split
     words = text.lower().split()
     
-    # Remove common stop words
-    stop_words = {
-        'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'your', 
-        'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 
-        'her', 'hers', 'herself', 'it', 'its', 'itself', 'they', 'them', 'their', 
-        'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', 
-        'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 
-        'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 
-        'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 
-        'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 
-        'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 
-        'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 
-        'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 
-        'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 
-        'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 
-        't', 'can', 'will', 'just', 'don', 'should', 'now'
-    }
-    
-    # Filter out stop words and non-alphanumeric words
-    filtered_words = [word for word in words if word not in stop_words and word.isalnum()]
+    if language == 'english':
+        ignored_words = stop_words
+    else:
+        ignored_words = language_resources.get(language)['stop_words']
     
-    # Count word frequencies
+    # Count frequencies of words that aren't stop words and are alphanumeric
     word_freq = {}
-    for word in filtered_words:
-        if word in word_freq:
-            word_freq[word] += 1
-        else:
-            word_freq[word] = 1
+    for word in words:
+        if word not in ignored_words and word.isalnum():
+            word_freq[word] = word_freq.get(word, 0) + 1
     
-    # Sort by frequency
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-    
-    # Return top keywords
-    return [word for word, freq in sorted_words[:max_keywords]]
+    return word_freq
+
+def top_keywords(word_freq, max_keywords=10):
+    """Return the most frequent words from a frequency dict"""
+    # nlargest keeps a heap of max_keywords entries instead of sorting every word
+    top_words = heapq.nlargest(max_keywords, word_freq.items(), key=lambda x: x[1])
+    return [word for word, freq in top_words]
+
+# Simple keyword extraction
+def extract_keywords(text, max_keywords=10, language='english'):
+    """
+    Extract keywords from text without using NLTK
+    """
+    return top_keywords(count_keywords(text, language), max_keywords)
+
+# Emotion keywords for the simple emotion detector
+emotion_keywords = {
+    'anxiety': ['anxious', 'worried', 'nervous', 'panic', 'fear', 'stress', 'tense', 'uneasy'],
+    'sadness': ['sad', 'depressed', 'unhappy', 'miserable', 'down', 'blue', 'grief', 'sorrow'],
+    'anger': ['angry', 'mad', 'frustrated', 'irritated', 'annoyed', 'furious', 'rage', 'hate'],
+    'fear': ['afraid', 'scared', 'terrified', 'frightened', 'fearful', 'phobia', 'terror'],
+    'joy': ['happy', 'joyful', 'excited', 'delighted', 'pleased', 'glad', 'content', 'cheerful'],
+    'surprise': ['surprised', 'shocked', 'amazed', 'astonished', 'stunned', 'unexpected'],
+    'disgust': ['disgusted', 'repulsed', 'revolted', 'gross', 'nauseous', 'sickened'],
+    'shame': ['ashamed', 'embarrassed', 'guilty', 'remorseful', 'regretful', 'humiliated'],
+    'confusion': ['confused', 'puzzled', 'perplexed', 'unsure', 'uncertain', 'lost', 'disoriented'],
+    'loneliness': ['lonely ', 'alone', 'isolated', 'abandoned', 'rejected', 'unwanted', 'solitary'],
+    'frustration': ['frustrated', 'fed up', 'exasperated', 'irritated', 'annoyed'],
+    'overwhelm': ['overwhelmed', 'stressed', 'burned out', 'exhausted'],
+    'pain': ['pain', 'hurt', 'ache', 'sore', 'suffering', 'discomfort', 'agony']
+}
 
 # Simple emotion detection
 def detect_emotions(text):
     """
     A simple rule-based emotion detector
     """
-    text = text.lower()
-    
-    emotion_keywords = {
-        'anxiety': ['anxious', 'worried', 'nervous', 'panic', 'fear', 'stress', 'tense', 'uneasy'],
-        'sadness': ['sad', 'depressed', 'unhappy', 'miserable', 'down', 'blue', 'grief', 'sorrow'],
-        'anger': ['angry', 'mad', 'frustrated', 'irritated', 'annoyed', 'furious', 'rage', 'hate'],
-        'fear': ['afraid', 'scared', 'terrified', 'frightened', 'fearful', 'phobia', 'terror'],
-        'joy': ['happy', 'joyful', 'excited', 'delighted', 'pleased', 'glad', 'content', 'cheerful'],
-        'surprise': ['surprised', 'shocked', 'amazed', 'astonished', 'stunned', 'unexpected'],
-        'disgust': ['disgusted', 'repulsed', 'revolted', 'gross', 'nauseous', 'sickened'],
-        'shame': ['ashamed', 'embarrassed', 'guilty', 'remorseful', 'regretful', 'humiliated'],
-        'confusion': ['confused', 'puzzled', 'perplexed', 'unsure', 'uncertain', 'lost', 'disoriented'],
-        'loneliness': ['lonely ', 'alone', 'isolated', 'abandoned', 'rejected', 'unwanted', 'solitary'],
-        'frustration': ['frustrated', 'fed up', 'exasperated', 'irritated', 'annoyed'],
-        'overwhelm': ['overwhelmed', 'stressed', 'burned out', 'exhausted'],
-        'pain': ['pain', 'hurt', 'ache', 'sore', 'suffering', 'discomfort', 'agony']
-    }
+    text = correct_misspellings(text.lower())
     
     detected_emotions = {}
     
@@ -265,6 +707,71 @@ else:
     except Exception as e:
         pass
 
+# TF-IDF resource ranking: resources are vectorized once at load time and
+# messages are scored with a sparse dot product over an inverted index
+RESOURCE_RANKING = os.environ.get('RESOURCE_RANKING', 'tags')
+RESOURCE_TAG_WEIGHT = 2
+stemmer = PorterStemmer()
+
+@functools.lru_cache(maxsize=16384)
+def stem(word):
+    return stemmer.stem(word)
+
+def resource_terms(text):
+    """Lowercase, drop stop words and stem text into index terms"""
+    return [stem(word) for word in re.findall(r'[a-z0-9]+', text.lower()) if word not in stop_words]
+
+class ResourceIndex:
+    """Inverted index of L2-normalised TF-IDF vectors over resource title, description and tags"""
+
+    def __init__(self, resources):
+        self.resources = resources
+        
+        term_counts = []
+        for resource in resources:
+            counts = {}
+            fields = [(resource.get('title', ''), 1), (resource.get('description', ''), 1)]
+            fields += [(tag, RESOURCE_TAG_WEIGHT) for tag in resource.get('tags', [])]
+            for text, weight in fields:
+                for term in resource_terms(text):
+                    counts[term] = counts.get(term, 0) + weight
+            term_counts.append(counts)
+        
+        document_frequency = {}
+        for counts in term_counts:
+            for term in counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        total = len(term_counts)
+        self.idf = {
+            term: math.log((1 + total) / (1 + frequency)) + 1
+            for term, frequency in document_frequency.items()
+        }
+        
+        self.postings = {}
+        for index, counts in enumerate(term_counts):
+            weights = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for term, weight in weights.items():
+                self.postings.setdefault(term, []).append((index, weight / norm))
+
+    def top_k(self, text, k=3):
+        """Return up to k (resource, score) pairs ranked by similarity to text"""
+        query = {}
+        for term in resource_terms(text):
+            if term in self.idf:
+                query[term] = query.get(term, 0) + 1
+        
+        scores = {}
+        for term, count in query.items():
+            query_weight = (1 + math.log(count)) * self.idf[term]
+            for index, weight in self.postings[term]:
+                scores[index] = scores.get(index, 0.0) + query_weight * weight
+        
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.resources[index], score) for index, score in best]
+
+resource_index = ResourceIndex(resources_data)
+
 # Crisis detection keywords
 crisis_keywords = [
     'suicide', 'kill myself', 'end my life', 'want to die',
@@ -272,6 +779,509 @@ crisis_keywords = [
     'better off dead', 'can\'t go on', 'give up', 'end it all'
 ]
 
+# Word stems that signal a crisis in any form ("suicidal", "suicidally")
+crisis_stems = ['suicid']
+crisis_stem_pattern = re.compile(r'\b(?:' + '|'.join(crisis_stems) + r')')
+
+# Misspelling-tolerant matching: SymSpell-style deletion indexes built once
+# over the sentiment and emotion vocabulary and, separately, the crisis words.
+# Only tokens that aren't real English words are ever corrected.
+FUZZY_MATCHING = os.environ.get('FUZZY_MATCHING', 'true').lower() == 'true'
+FUZZY_MAX_DISTANCE = 2
+fuzzy_token = re.compile(r'[a-z]+')
+
+# Suffixes stripped to recognise inflections of known words ("shared", "given")
+inflection_suffixes = ('ing', 'ies', 'ied', 'est', 'ed', 'en', 'es', 'er', 'ly', 's', 'd', 'n')
+
+# Bundled fallback wordlist: the word types Punkt's English model was trained
+# on, so correction works even without the NLTK words corpus
+english_words_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'english_words.txt')
+
+known_words = None
+known_words_lock = threading.Lock()
+
+def load_known_words():
+    """English wordlist from the bundled list and the NLTK words and stopwords corpora, loaded on first use"""
+    global known_words
+    if known_words is not None:
+        return known_words
+    with known_words_lock:
+        if known_words is None:
+            words = set(stop_words)
+            with open(english_words_file, encoding='utf-8') as f:
+                words.update(line.strip() for line in f if line.strip())
+            for corpus in ('corpora/words/en', 'corpora/stopwords/english'):
+                try:
+                    with nltk.data.find(corpus).open(encoding='utf-8') as f:
+                        words.update(line.strip().lower() for line in f if line.strip())
+                except LookupError:
+                    logger.info(f"NLTK {corpus} unavailable, using the bundled wordlist")
+            known_words = frozenset(words)
+    return known_words
+
+def is_known_word(word, words):
+    """Whether word, or a regular inflection of it, is in the wordlist or the VADER lexicon"""
+    if word in words:
+        return True
+    lexicon = load_vader_lexicon()
+    if lexicon and lexicon.get(word) is not None:
+        return True
+    for suffix in inflection_suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            stem = word[:-len(suffix)]
+            if suffix in ('ies', 'ied') and stem + 'y' in words:
+                return True
+            # "share" + "d", "give" + "n", "stop" + "p" + "ing"
+            if stem in words or stem + 'e' in words or (stem[-1] == stem[-2] and stem[:-1] in words):
+                return True
+    return False
+
+def fuzzy_max_distance(word):
+    """Allowed edit distance for a token; short words are too easily confused"""
+    if len(word) < 5:
+        return 0
+    if len(word) < 8:
+        return 1
+    return FUZZY_MAX_DISTANCE
+
+def single_deletes(words):
+    return {word[:i] + word[i + 1:] for word in words for i in range(len(word))}
+
+def deletes_within(word, distance):
+    """All strings reachable from word by deleting up to distance characters"""
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = single_deletes(frontier)
+        results |= frontier
+    return results
+
+def edit_distance(source, target, max_distance):
+    """Optimal string alignment distance, giving up once it exceeds max_distance"""
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and source[i - 1] == target[j - 2]
+                    and source[i - 2] == target[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+class DeletionIndex:
+    """Maps every deletion variant of the vocabulary back to the words it came from"""
+
+    def __init__(self, vocabulary, max_distance=FUZZY_MAX_DISTANCE):
+        self.vocabulary = frozenset(vocabulary)
+        self.deletes = {}
+        for word in self.vocabulary:
+            for variant in deletes_within(word, max_distance):
+                self.deletes.setdefault(variant, []).append(word)
+        self.lookup = functools.lru_cache(maxsize=16384)(self.correct)
+
+    def correct(self, token, max_distance):
+        """Return the closest vocabulary word within max_distance, or None"""
+        candidates = set()
+        for variant in deletes_within(token, max_distance):
+            candidates.update(self.deletes.get(variant, ()))
+        
+        best = None
+        best_distance = max_distance + 1
+        for word in sorted(candidates):
+            distance = edit_distance(token, word, best_distance - 1 if best else max_distance)
+            if distance < best_distance:
+                best = word
+                best_distance = distance
+        return best
+
+fuzzy_vocabulary = set(positive_words) | set(negative_words)
+for phrase in [keyword for keywords in emotion_keywords.values() for keyword in keywords]:
+    fuzzy_vocabulary.update(fuzzy_token.findall(phrase))
+fuzzy_index = DeletionIndex(fuzzy_vocabulary)
+
+# Crisis phrases are only completed from misspellings of their distinctive
+# words ("suicde", "sucidal", "myslef"); common words like "give", "end" or
+# "die" never become crisis words through correction
+crisis_fuzzy_vocabulary = {
+    word for phrase in crisis_keywords for word in fuzzy_token.findall(phrase)
+    if len(word) >= 6 and word not in fuzzy_vocabulary
+} | {'suicidal'}
+crisis_fuzzy_index = DeletionIndex(crisis_fuzzy_vocabulary)
+
+def correct_token(word, index, words):
+    if word in index.vocabulary:
+        return word
+    distance = fuzzy_max_distance(word)
+    if not distance or is_known_word(word, words):
+        return word
+    return index.lookup(word, distance) or word
+
+def correct_misspellings(text, index=fuzzy_index):
+    """Replace misspelled vocabulary words (e.g. "anxius", "depresed") in lowercase text"""
+    if not FUZZY_MATCHING:
+        return text
+    words = load_known_words()
+    return fuzzy_token.sub(lambda match: correct_token(match.group(), index, words), text)
+
+# Language-aware analysis: per-language tokenizers, stop words, lexicons and
+# crisis phrases are loaded on first use and kept in a memory-bounded LRU
+LANGUAGE_CACHE_BYTES = int(os.environ.get('LANGUAGE_CACHE_BYTES', 32 * 1024 * 1024))
+LANGUAGE_DETECT_TOKENS = int(os.environ.get('LANGUAGE_DETECT_TOKENS', 40))
+
+# Marker hits a language needs, and its lead over English, before a message
+# is routed away from English
+LANGUAGE_DETECT_MIN_HITS = 2
+LANGUAGE_DETECT_MARGIN = 2
+
+# A handful of frequent function words per language, enough to tell them apart.
+# Single letters and words that also occur in English text ("die", "at", "to",
+# "men", "see") are left out so short English messages are never misrouted.
+language_markers = {
+    'english': ['the', 'and', 'is', 'are', 'you', 'my', 'not', 'with', 'have', 'it', 'this', 'was', 'feel'],
+    'spanish': ['el', 'los', 'las', 'que', 'es', 'estoy', 'muy', 'pero', 'por', 'siento'],
+    'french': ['le', 'les', 'et', 'est', 'je', 'pas', 'une', 'des', 'suis', 'très', 'mais', 'avec'],
+    'german': ['der', 'das', 'und', 'ist', 'ich', 'nicht', 'ein', 'eine', 'mit', 'sehr', 'aber', 'mich'],
+    'italian': ['il', 'che', 'non', 'sono', 'una', 'molto', 'ho', 'mi'],
+    'portuguese': ['os', 'que', 'não', 'uma', 'com', 'para', 'estou', 'muito', 'eu'],
+    'dutch': ['het', 'een', 'ik', 'niet', 'dat', 'maar', 'ook'],
+    'swedish': ['och', 'det', 'att', 'är', 'jag', 'inte', 'som', 'med', 'på', 'har', 'mycket'],
+    'norwegian': ['og', 'det', 'jeg', 'ikke', 'som', 'med', 'på', 'har', 'veldig'],
+    'danish': ['og', 'det', 'jeg', 'ikke', 'som', 'med', 'på', 'har', 'meget'],
+    'finnish': ['ja', 'ei', 'minä', 'että', 'olen', 'kuin', 'mutta', 'hyvin', 'myös'],
+    'estonian': ['ja', 'ei', 'olen', 'kui', 'aga', 'väga'],
+    'czech': ['je', 'že', 'jsem', 'velmi', 'jak'],
+    'polish': ['nie', 'się', 'że', 'jest', 'jestem', 'bardzo'],
+    'slovene': ['je', 'sem', 'ampak', 'zelo', 'kot'],
+    'turkish': ['ve', 'bir', 'bu', 'çok', 'ama', 'değil', 'için', 'ile']
+}
+
+# Word -> languages it marks, each weighted by how many languages share it
+language_marker_index = {}
+for marker_language, markers in language_markers.items():
+    for marker in markers:
+        language_marker_index.setdefault(marker, []).append(marker_language)
+
+# Languages recognised by script rather than by vocabulary
+language_scripts = [
+    ('greek', re.compile(r'[\u0370-\u03ff]')),
+    ('russian', re.compile(r'[\u0400-\u04ff]')),
+    ('malayalam', re.compile(r'[\u0d00-\u0d7f]'))
+]
+
+# Crisis phrases checked in addition to the English ones
+language_crisis_keywords = {
+    'spanish': ['suicidio', 'suicidarme', 'matarme', 'quiero morir', 'quitarme la vida', 'hacerme daño', 'no quiero vivir'],
+    'french': ['suicide', 'me suicider', 'me tuer', 'veux mourir', 'en finir', 'me faire du mal'],
+    'german': ['selbstmord', 'suizid', 'mich umbringen', 'will sterben', 'mir das leben nehmen', 'mir weh tun'],
+    'italian': ['suicidio', 'uccidermi', 'voglio morire', 'togliermi la vita', 'farmi del male'],
+    'portuguese': ['suicídio', 'me matar', 'quero morrer', 'tirar minha vida', 'me machucar'],
+    'dutch': ['zelfmoord', 'mezelf doden', 'wil dood', 'er een eind aan maken']
+}
+
+# Every language the analysis pipeline has resources for
+supported_languages = frozenset(
+    ['english'] + list(language_markers) + [language for language, script in language_scripts]
+)
+
+def detect_language(text):
+    """Cheaply guess the language of a message from its script or function words"""
+    for language, script in language_scripts:
+        if script.search(text):
+            return language
+
+    scores = {}
+    hits = {}
+    for word in text.lower().split()[:LANGUAGE_DETECT_TOKENS]:
+        languages = language_marker_index.get(word.strip(string.punctuation))
+        if languages:
+            for language in languages:
+                scores[language] = scores.get(language, 0) + 1.0 / len(languages)
+                hits[language] = hits.get(language, 0) + 1
+
+    if not scores:
+        return 'english'
+    best = max(scores, key=scores.get)
+    # Stay with English unless another language is clearly ahead of it
+    if (best == 'english' or hits[best] < LANGUAGE_DETECT_MIN_HITS
+            or hits[best] - hits.get('english', 0) < LANGUAGE_DETECT_MARGIN):
+        return 'english'
+    return best
+
+def resolve_language(requested, text):
+    """Validate a client-supplied language, detecting one from text if none was given
+
+    Returns None for anything that isn't a supported language name, since the
+    name is used to build resource paths.
+    """
+    if requested is None or requested == '':
+        return detect_language(text)
+    if isinstance(requested, str) and requested in supported_languages:
+        return requested
+    return None
+
+def estimate_size(obj):
+    """Approximate memory footprint of a container and its direct items"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in obj.items())
+    elif isinstance(obj, (set, frozenset, list, tuple)):
+        size += sum(sys.getsizeof(item) for item in obj)
+    return size
+
+def load_language_resources(language):
+    """Load a language's tokenizer, stop words, lexicon and crisis phrases"""
+    if language not in supported_languages:
+        raise ValueError(f"Unsupported language: {language!r}")
+    size = 0
+
+    try:
+        # punkt_tab parameters are plain text, never unpickled
+        tokenizer = PunktTokenizer(language)
+        params = tokenizer._params
+        for container in (params.abbrev_types, params.collocations, params.sent_starters, params.ortho_context):
+            size += estimate_size(container)
+    except Exception as e:
+        logger.warning(f"Punkt tokenizer for {language} unavailable, splitting on punctuation: {str(e)}")
+        tokenizer = None
+
+    if language == 'english':
+        language_stop_words = stop_words
+    else:
+        try:
+            with open(nltk.data.find(f'corpora/stopwords/{language}').path, encoding='utf-8') as f:
+                language_stop_words = frozenset(line.strip() for line in f if line.strip())
+        except Exception:
+            language_stop_words = frozenset()
+        size += estimate_size(language_stop_words)
+
+    # Optional lexicon in vader_lexicon format, e.g. nltk_data/sentiment/spanish_lexicon.txt
+    lexicon = None
+    lexicon_path = os.path.join(nltk_data_dir, 'sentiment', f'{language}_lexicon.txt')
+    if language != 'english' and os.path.exists(lexicon_path):
+        lexicon = {}
+        with open(lexicon_path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split('\t')
+                if len(parts) >= 2:
+                    lexicon[parts[0].lower()] = float(parts[1])
+        size += estimate_size(lexicon)
+
+    language_crisis = crisis_keywords + language_crisis_keywords.get(language, [])
+    size += estimate_size(language_crisis)
+
+    resources = {
+        'tokenizer': tokenizer,
+        'stop_words': language_stop_words,
+        'lexicon': lexicon,
+        'crisis_keywords': language_crisis
+    }
+    return resources, size
+
+class LanguageResourceCache:
+    """LRU of per-language resources bounded by an approximate memory budget"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_size = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, language):
+        with self.lock:
+            entry = self.entries.get(language)
+            if entry is not None:
+                self.entries.move_to_end(language)
+                self.hits += 1
+                return entry[0]
+
+        # Load outside the lock so one slow language doesn't block the others
+        resources, size = load_language_resources(language)
+
+        with self.lock:
+            if language not in self.entries:
+                self.entries[language] = (resources, size)
+                self.total_size += size
+                self.loads += 1
+                # Always keep the entry just loaded, even if it alone exceeds the budget
+                while self.total_size > self.budget and len(self.entries) > 1:
+                    evicted, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.total_size -= evicted_size
+                    self.evictions += 1
+                    logger.info(f"Evicted {evicted} language resources ({evicted_size} bytes)")
+            return self.entries[language][0]
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "languages": {language: size for language, (_, size) in self.entries.items()},
+                "bytes": self.total_size,
+                "budget": self.budget,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
+
+language_resources = LanguageResourceCache(LANGUAGE_CACHE_BYTES)
+
+def detect_crisis(text, language='english'):
+    """Check text for crisis keywords"""
+    text = text.lower()
+    if language == 'english':
+        keywords = crisis_keywords
+    else:
+        keywords = language_resources.get(language)['crisis_keywords']
+    if any(keyword in text for keyword in keywords) or crisis_stem_pattern.search(text):
+        return True
+    corrected = correct_misspellings(text, crisis_fuzzy_index)
+    return corrected != text and (
+        any(keyword in corrected for keyword in keywords) or crisis_stem_pattern.search(corrected) is not None
+    )
+
+# Long-text analysis: sentences are grouped into bounded chunks and analyzed
+# as a generator pipeline, optionally across a process pool
+LONG_TEXT_CHUNK_CHARS = int(os.environ.get('LONG_TEXT_CHUNK_CHARS', 2000))
+LONG_TEXT_WORKERS = int(os.environ.get('LONG_TEXT_WORKERS', os.cpu_count() or 1))
+sentence_pattern = re.compile(r'[^.!?\n]+[.!?]*')
+
+def get_sentence_tokenizer(language='english'):
+    """Get the bundled punkt sentence tokenizer for a language, loading it on first use"""
+    return language_resources.get(language)['tokenizer']
+
+def iter_sentence_spans(text, language='english'):
+    """Yield (start, end) offsets of each sentence in text"""
+    tokenizer = get_sentence_tokenizer(language)
+    if tokenizer is not None:
+        yield from tokenizer.span_tokenize(text)
+    else:
+        for match in sentence_pattern.finditer(text):
+            if match.group().strip():
+                yield match.span()
+
+def iter_sentence_chunks(text, language='english', max_chars=LONG_TEXT_CHUNK_CHARS):
+    """Group sentences into chunks of roughly max_chars as (start, sentence) lists"""
+    chunk = []
+    size = 0
+    for start, end in iter_sentence_spans(text, language):
+        chunk.append((start, text[start:end]))
+        size += end - start
+        if size >= max_chars:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+def analyze_sentence_chunk(chunk, mode=None, detailed=True, language='english'):
+    """
+    Analyze each sentence in a chunk, returning per-sentence results and the
+    chunk's merged keyword counts
+    """
+    results = []
+    word_freq = {}
+    for start, sentence in chunk:
+        result = sentiment_analysis(sentence, mode, language)
+        result['start'] = start
+        result['end'] = start + len(sentence)
+        result['weight'] = len(sentence.split())
+        if detailed:
+            result['emotions'] = detect_emotions(sentence)
+            result['is_crisis'] = detect_crisis(sentence, language)
+        results.append(result)
+        for word, count in count_keywords(sentence, language).items():
+            word_freq[word] = word_freq.get(word, 0) + count
+    return results, word_freq
+
+analysis_executor = None
+analysis_executor_lock = threading.Lock()
+
+def get_analysis_executor():
+    """Create the shared process pool for parallel long-text analysis on first use"""
+    global analysis_executor
+    with analysis_executor_lock:
+        if analysis_executor is None:
+            analysis_executor = ProcessPoolExecutor(max_workers=LONG_TEXT_WORKERS)
+    return analysis_executor
+
+def iter_chunk_results(chunks, mode=None, parallel=False, detailed=True, language='english'):
+    """Analyze chunks in order, keeping at most two chunks per worker in flight"""
+    if not parallel:
+        for chunk in chunks:
+            yield analyze_sentence_chunk(chunk, mode, detailed, language)
+        return
+
+    executor = get_analysis_executor()
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(analyze_sentence_chunk, chunk, mode, detailed, language))
+        if len(pending) >= LONG_TEXT_WORKERS * 2:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def aggregate_sentence_results(chunk_results, include_sentences=True, max_keywords=10):
+    """Merge per-sentence results into word-weighted overall scores"""
+    sentences = []
+    word_freq = {}
+    emotions = {}
+    is_crisis = False
+    totals = {'compound_score': 0.0, 'positive_score': 0.0, 'negative_score': 0.0, 'neutral_score': 0.0}
+    total_weight = 0
+
+    for results, chunk_freq in chunk_results:
+        for result in results:
+            weight = result['weight']
+            total_weight += weight
+            for key in totals:
+                totals[key] += result[key] * weight
+            for emotion, count in result.get('emotions', {}).items():
+                emotions[emotion] = emotions.get(emotion, 0) + count
+            is_crisis = is_crisis or result.get('is_crisis', False)
+            if include_sentences:
+                sentences.append(result)
+        for word, count in chunk_freq.items():
+            word_freq[word] = word_freq.get(word, 0) + count
+
+    aggregated = {key: value / total_weight if total_weight else 0.0 for key, value in totals.items()}
+    if not total_weight:
+        aggregated['neutral_score'] = 1.0
+
+    if aggregated['compound_score'] >= 0.05:
+        sentiment = 'positive'
+    elif aggregated['compound_score'] <= -0.05:
+        sentiment = 'negative'
+    else:
+        sentiment = 'neutral'
+
+    result = {
+        'sentiment': sentiment,
+        **aggregated,
+        'keywords': top_keywords(word_freq, max_keywords),
+        'emotions': emotions,
+        'is_crisis': is_crisis
+    }
+    if include_sentences:
+        result['sentences'] = sentences
+    return result
+
+def analyze_long_text(text, mode=None, parallel=False, language='english', include_sentences=True):
+    """Sentence-chunked analysis of long text with per-sentence and overall scores"""
+    chunks = iter_sentence_chunks(text, language)
+    result = aggregate_sentence_results(
+        iter_chunk_results(chunks, mode, parallel, language=language), include_sentences
+    )
+    result['language'] = language
+    return result
+
 # Response templates
 response_templates = {
     'greeting': [
@@ -349,6 +1359,329 @@ coping_strategies = {
         "Distraction techniques like engaging in an absorbing activity can temporarily shift focus away from pain."
     ]
 }
+# Admission control: per-route concurrency limits, priority-based load
+# shedding and a per-user token bucket for chat processing
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 64))
+ADMISSION_ROUTE_LIMIT = int(os.environ.get('ADMISSION_ROUTE_LIMIT', 32))
+ADMISSION_USER_RATE = float(os.environ.get('ADMISSION_USER_RATE', 2.0))
+ADMISSION_USER_BURST = float(os.environ.get('ADMISSION_USER_BURST', 10))
+ADMISSION_MAX_TRACKED_USERS = int(os.environ.get('ADMISSION_MAX_TRACKED_USERS', 10000))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+# Crisis messages have their own capacity and their own, more generous per-user
+# bucket; beyond either they are admitted like any other request
+ADMISSION_CRISIS_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_CRISIS_MAX_IN_FLIGHT', 16))
+ADMISSION_CRISIS_USER_RATE = float(os.environ.get('ADMISSION_CRISIS_USER_RATE', 2.0))
+ADMISSION_CRISIS_USER_BURST = float(os.environ.get('ADMISSION_CRISIS_USER_BURST', 20))
+
+# Share of total capacity each priority may use before it is shed
+admission_priority_thresholds = {
+    'high': 1.0,
+    'normal': 0.8,
+    'low': 0.5
+}
+
+class AdmissionController:
+    """In-process limiter state shared by all admission-controlled routes"""
+
+    def __init__(self, max_in_flight, user_rate, user_burst, max_tracked_users,
+                 max_crisis_in_flight, crisis_user_rate, crisis_user_burst):
+        self.max_in_flight = max_in_flight
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_tracked_users = max_tracked_users
+        self.max_crisis_in_flight = max_crisis_in_flight
+        self.crisis_user_rate = crisis_user_rate
+        self.crisis_user_burst = crisis_user_burst
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.crisis_in_flight = 0
+        self.routes = {}
+        self.buckets = OrderedDict()
+
+    def route_stats(self, route, priority):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {
+                "priority": priority, "inFlight": 0, "admitted": 0, "shed": 0, "rateLimited": 0,
+                "crisis": 0, "crisisOverflow": 0
+            }
+        return stats
+
+    def try_acquire(self, route, limit, priority):
+        """Admit a request unless its route is full or its priority is being shed"""
+        with self.lock:
+            stats = self.route_stats(route, priority)
+            threshold = self.max_in_flight * admission_priority_thresholds[priority]
+            if stats["inFlight"] >= limit or self.in_flight >= threshold:
+                stats["shed"] += 1
+                return False
+            stats["inFlight"] += 1
+            stats["admitted"] += 1
+            self.in_flight += 1
+            return True
+
+    def release(self, route, crisis=False):
+        with self.lock:
+            self.routes[route]["inFlight"] -= 1
+            self.in_flight -= 1
+            if crisis:
+                self.crisis_in_flight -= 1
+
+    def take_token(self, key, rate, burst, now):
+        """Take a token from a bucket, returning seconds to wait if it is empty; call with the lock held"""
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self.buckets[key] = (tokens - 1, now)
+        self.buckets.move_to_end(key)
+        # Forget the least recently seen callers once too many are tracked
+        while len(self.buckets) > self.max_tracked_users:
+            self.buckets.popitem(last=False)
+        return 0
+
+    def consume(self, route, priority, key):
+        """Take a token from the caller's bucket, returning seconds to wait if it is empty"""
+        now = time.monotonic()
+        with self.lock:
+            retry_after = self.take_token(key, self.user_rate, self.user_burst, now)
+            if retry_after:
+                self.route_stats(route, priority)["rateLimited"] += 1
+            return retry_after
+
+    def acquire_crisis(self, route, priority, key):
+        """Admit a crisis request ahead of the other limits if the lane and the caller's crisis bucket have room"""
+        now = time.monotonic()
+        with self.lock:
+            stats = self.route_stats(route, priority)
+            if (self.crisis_in_flight >= self.max_crisis_in_flight
+                    or self.take_token(('crisis', key), self.crisis_user_rate, self.crisis_user_burst, now)):
+                stats["crisisOverflow"] += 1
+                return False
+            stats["inFlight"] += 1
+            stats["admitted"] += 1
+            stats["crisis"] += 1
+            self.in_flight += 1
+            self.crisis_in_flight += 1
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "inFlight": self.in_flight,
+                "maxInFlight": self.max_in_flight,
+                "crisisInFlight": self.crisis_in_flight,
+                "maxCrisisInFlight": self.max_crisis_in_flight,
+                "trackedUsers": len(self.buckets),
+                "routes": {route: dict(stats) for route, stats in self.routes.items()}
+            }
+
+admission = AdmissionController(
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_USER_RATE, ADMISSION_USER_BURST, ADMISSION_MAX_TRACKED_USERS,
+    ADMISSION_CRISIS_MAX_IN_FLIGHT, ADMISSION_CRISIS_USER_RATE, ADMISSION_CRISIS_USER_BURST
+)
+
+# Crisis priority lane: messages matching a crisis phrase skip rate limiting and
+# load shedding (up to ADMISSION_CRISIS_MAX_IN_FLIGHT at a time), get the crisis
+# template and precomputed crisis resources straight away, and have the rest of
+# their analysis finished in the background
+CRISIS_SLO_MS = float(os.environ.get('CRISIS_SLO_MS', 250))
+CRISIS_LATENCY_WINDOW = int(os.environ.get('CRISIS_LATENCY_WINDOW', 1000))
+
+# Exact phrases in every supported language; misspellings are still caught by
+# detect_crisis in the regular pipeline
+crisis_phrase_pattern = re.compile('|'.join(
+    [re.escape(phrase) for phrase in sorted(
+        set(crisis_keywords).union(*language_crisis_keywords.values()), key=len, reverse=True
+    )] + [crisis_stem_pattern.pattern]
+))
+crisis_resources = [r for r in resources_data if 'crisis' in [tag.lower() for tag in r.get('tags', [])]][:3]
+
+def is_crisis_message(text):
+    """Cheap crisis pre-pass run before admission and analysis"""
+    return bool(text) and crisis_phrase_pattern.search(text.lower()) is not None
+
+def is_crisis_request():
+    """Whether the current request carries a crisis message
+
+    Only the server-side phrase check counts; a client-supplied isCrisis flag
+    must not be a way around rate limiting.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return False
+    return is_crisis_message(str(data.get('message') or ''))
+
+class CrisisLatencyTracker:
+    """Latency of crisis replies over a sliding window, measured against CRISIS_SLO_MS"""
+
+    def __init__(self, slo_ms, window):
+        self.slo_ms = slo_ms
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.breaches = 0
+
+    def record(self, elapsed_ms):
+        with self.lock:
+            self.samples.append(elapsed_ms)
+            self.count += 1
+            if elapsed_ms > self.slo_ms:
+                self.breaches += 1
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self.samples)
+            count, breaches = self.count, self.breaches
+        
+        def percentile(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2)
+        
+        return {
+            "count": count,
+            "sloMs": self.slo_ms,
+            "breaches": breaches,
+            "withinSlo": round(1 - breaches / count, 4) if count else None,
+            "p50Ms": percentile(0.5),
+            "p95Ms": percentile(0.95),
+            "p99Ms": percentile(0.99),
+            "maxMs": round(samples[-1], 2) if samples else None
+        }
+
+crisis_latency = CrisisLatencyTracker(CRISIS_SLO_MS, CRISIS_LATENCY_WINDOW)
+
+# Deferred analysis runs on a small pool with a bounded backlog; once the
+# backlog is full, work runs inline so a flood slows callers down instead of
+# growing the queue without limit
+FOLLOWUP_WORKERS = int(os.environ.get('FOLLOWUP_WORKERS', 2))
+FOLLOWUP_QUEUE_SIZE = int(os.environ.get('FOLLOWUP_QUEUE_SIZE', 256))
+followup_executor = ThreadPoolExecutor(max_workers=FOLLOWUP_WORKERS, thread_name_prefix='analysis-followup')
+followup_slots = threading.BoundedSemaphore(FOLLOWUP_QUEUE_SIZE)
+
+def run_in_background(func, *args):
+    """Run deferred analysis off the request path, logging rather than raising failures"""
+    def run():
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Deferred analysis failed: {str(e)}")
+    
+    if not followup_slots.acquire(blocking=False):
+        logger.warning("Deferred analysis backlog full, running inline")
+        run()
+        return None
+    
+    def run_and_release():
+        try:
+            run()
+        finally:
+            followup_slots.release()
+    return followup_executor.submit(run_and_release)
+
+def admission_key():
+    """Identify the caller for rate limiting: JWT identity, then userId, then address"""
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:
+        user_id = None
+    if not user_id:
+        data = request.get_json(silent=True) or {}
+        user_id = data.get('userId') if isinstance(data, dict) else None
+    return str(user_id or request.remote_addr)
+
+def admission_control(priority='normal', limit=None, rate_limited=False, crisis_lane=False):
+    """Decorate a route with concurrency limiting, load shedding and optional per-user rate limiting
+
+    With crisis_lane, requests carrying a crisis message bypass the other
+    limits while the crisis lane and the caller's crisis bucket have room, and
+    g.crisis is set so the view can take its fast path.
+    """
+    def decorator(view):
+        def admit(route, args, kwargs):
+            if g.crisis and admission.acquire_crisis(route, priority, admission_key()):
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    admission.release(route, crisis=True)
+            
+            if rate_limited:
+                retry_after = admission.consume(route, priority, admission_key())
+                if retry_after:
+                    response = jsonify({"message": "Too many requests, please slow down"})
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response, 429
+            
+            if not admission.try_acquire(route, limit or ADMISSION_ROUTE_LIMIT, priority):
+                response = jsonify({"message": "Service is busy, please try again shortly"})
+                response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+                return response, 503
+            
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission.release(route)
+        
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            route = request.endpoint
+            g.crisis = crisis_lane and is_crisis_request()
+            if not g.crisis:
+                return admit(route, args, kwargs)
+            
+            # Crisis replies are timed whether or not they got into the crisis lane
+            started = time.perf_counter()
+            try:
+                return admit(route, args, kwargs)
+            finally:
+                crisis_latency.record((time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+# Conditional GET and response compression
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+def make_etag(*parts):
+    """Build an ETag value from the parts that identify a representation"""
+    return hashlib.sha1("|".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def not_modified(etag):
+    """Return a 304 response if the client's cached copy matches etag, otherwise None"""
+    if request.if_none_match.contains_weak(etag):
+        return tag_response(app.response_class(status=304), etag)
+    return None
+
+def tag_response(response, etag):
+    """Attach a weak ETag and ask clients to revalidate before reusing the response"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON responses with brotli or gzip when the client accepts it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=min(COMPRESS_LEVEL, 11)))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    else:
+        return response
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/')
 def index():
     html_content = """
@@ -374,8 +1707,10 @@ def index():
             <ul>
                 <li><strong>Auth:</strong> <code>/api/auth/register</code> & <code>/api/auth/login</code></li>
                 <li><strong>Profile:</strong> <code>/api/users/profile</code> (GET/PUT)</li>
+                <li><strong>Export:</strong> <code>/api/users/export</code> (NDJSON, <code>?compress=gzip</code>)</li>
                 <li><strong>Chats:</strong> <code>/api/chats</code> (GET/POST/DELETE)</li>
                 <li><strong>Analysis:</strong> <code>/api/analyze</code> & <code>/api/process</code></li>
+                <li><strong>Metrics:</strong> <code>/api/metrics</code></li>
             </ul>
             <p><em>API is running on port {port}. Use JWT for authenticated routes.</em></p>
         </div>
@@ -384,6 +1719,16 @@ def index():
     """.format(port=os.environ.get('PORT', 5000))
     return html_content, 200
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        "mongo": mongo_metrics.snapshot(),
+        "languageResources": language_resources.snapshot(),
+        "admission": admission.snapshot(),
+        "chatState": chat_states.snapshot(),
+        "crisis": crisis_latency.snapshot()
+    }), 200
+
 
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -420,7 +1765,14 @@ def get_profile():
     if not user:
         return jsonify({"message": "User not found"}), 404
     
-    return jsonify(format_user(user)), 200
+    # Profiles are small, so the ETag is taken from the formatted document itself
+    profile = format_user(user)
+    etag = make_etag(app.json.dumps_bytes(profile))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    return tag_response(jsonify(profile), etag), 200
 
 @app.route('/api/users/profile', methods=['PUT'])
 @jwt_required()
@@ -514,21 +1866,107 @@ def delete_account():
     
     # Delete user's data
     db.chats.delete_many({"userId": ObjectId(user_id)})
+    chat_states.discard_user(user_id)
     db.journal_entries.delete_many({"userId": ObjectId(user_id)})
     db.mood_entries.delete_many({"userId": ObjectId(user_id)})
     db.interaction_logs.delete_many({"userId": ObjectId(user_id)})
     db.sessions.delete_many({"userId": ObjectId(user_id)})
+    db.mood_buckets.delete_many({"userId": ObjectId(user_id)})
+    db.user_themes.delete_many({"userId": ObjectId(user_id)})
+    delete_avatar_files({"metadata.userId": ObjectId(user_id)})
     
     # Delete user
     db.users.delete_one({"_id": ObjectId(user_id)})
     
     return jsonify({"message": "Account deleted successfully"}), 200
 
+# Avatar storage: uploads are streamed into GridFS in chunks and thumbnails are
+# generated once by a background worker, never on the request path
+AVATAR_MAX_BYTES = int(os.environ.get('AVATAR_MAX_BYTES', 5 * 1024 * 1024))
+# Room for multipart boundaries and part headers around the file itself
+AVATAR_MULTIPART_OVERHEAD = 64 * 1024
+AVATAR_CHUNK_BYTES = 255 * 1024
+AVATAR_THUMBNAIL_SIZE = int(os.environ.get('AVATAR_THUMBNAIL_SIZE', 128))
+avatar_content_types = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+avatar_bucket = gridfs.GridFSBucket(db, bucket_name='avatars')
+thumbnail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+
+def avatar_url(file_id):
+    return f"/api/avatars/{file_id}"
+
+def store_avatar(user_id, file):
+    """Stream an uploaded file into GridFS, returning its id or None if it is too large"""
+    grid_in = avatar_bucket.open_upload_stream(
+        secure_filename(file.filename) or 'avatar',
+        chunk_size_bytes=AVATAR_CHUNK_BYTES,
+        metadata={"userId": user_id, "contentType": file.mimetype}
+    )
+    size = 0
+    try:
+        while True:
+            chunk = file.stream.read(AVATAR_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > AVATAR_MAX_BYTES:
+                grid_in.abort()
+                return None
+            grid_in.write(chunk)
+        grid_in.close()
+    except Exception:
+        grid_in.abort()
+        raise
+    return grid_in._id
+
+def delete_avatar_files(query):
+    """Delete stored avatars and thumbnails matching a files-collection query"""
+    for grid_file in db['avatars.files'].find(query, {"_id": 1}):
+        try:
+            avatar_bucket.delete(grid_file["_id"])
+        except gridfs.errors.NoFile:
+            pass
+
+def generate_avatar_thumbnail(user_id, file_id):
+    """Resize a stored avatar into a thumbnail and attach it to the user (runs in the background)"""
+    try:
+        with avatar_bucket.open_download_stream(file_id) as source:
+            image = Image.open(source)
+            image.draft('RGB', (AVATAR_THUMBNAIL_SIZE, AVATAR_THUMBNAIL_SIZE))
+            image.thumbnail((AVATAR_THUMBNAIL_SIZE, AVATAR_THUMBNAIL_SIZE))
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image_format, content_type = 'PNG', 'image/png'
+            else:
+                image_format, content_type = 'JPEG', 'image/jpeg'
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, image_format)
+        buffer.seek(0)
+        
+        thumbnail_id = avatar_bucket.upload_from_stream(
+            f"thumbnail_{file_id}",
+            buffer,
+            metadata={"userId": user_id, "contentType": content_type, "thumbnailOf": file_id}
+        )
+        
+        # Only attach the thumbnail if the avatar wasn't replaced in the meantime
+        result = db.users.update_one(
+            {"_id": user_id, "avatarId": file_id},
+            {"$set": {"avatarThumbnailId": thumbnail_id, "avatarThumbnail": avatar_url(thumbnail_id)}}
+        )
+        if result.matched_count == 0:
+            avatar_bucket.delete(thumbnail_id)
+    except Exception as e:
+        logger.error(f"Error generating thumbnail for avatar {file_id}: {str(e)}")
+
 @app.route('/api/users/upload-avatar', methods=['POST'])
 @jwt_required()
 def upload_avatar():
     user_id = get_jwt_identity()
     
+    # Reject oversized uploads from the Content-Length header, before the body is read and spooled
+    if request.content_length and request.content_length > AVATAR_MAX_BYTES + AVATAR_MULTIPART_OVERHEAD:
+        return jsonify({"message": f"Avatar must be smaller than {AVATAR_MAX_BYTES / (1024 * 1024):g} MB"}), 413
+    
     # Check if file is in request
     if 'avatar' not in request.files:
         return jsonify({"message": "No file provided"}), 400
@@ -539,23 +1977,102 @@ def upload_avatar():
     if file.filename == '':
         return jsonify({"message": "No file selected"}), 400
     
-    # In a real app, you would upload to cloud storage and get a URL
-    # For this example, we'll simulate by storing a placeholder URL
-    avatar_url = f"/uploads/avatars/{user_id}_{file.filename}"
+    if file.mimetype not in avatar_content_types:
+        return jsonify({"message": "Avatar must be a PNG, JPEG, GIF or WebP image"}), 400
+    
+    # Find user
+    user = db.users.find_one({"_id": ObjectId(user_id)}, {"avatarId": 1, "avatarThumbnailId": 1})
+    
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    file_id = store_avatar(ObjectId(user_id), file)
+    
+    if file_id is None:
+        return jsonify({"message": f"Avatar must be smaller than {AVATAR_MAX_BYTES / (1024 * 1024):g} MB"}), 413
     
     # Update user's avatar
     db.users.update_one(
         {"_id": ObjectId(user_id)},
-        {"$set": {"avatar": avatar_url}}
+        {
+            "$set": {"avatar": avatar_url(file_id), "avatarId": file_id},
+            "$unset": {"avatarThumbnail": "", "avatarThumbnailId": ""}
+        }
     )
     
+    # Remove the previous avatar and its thumbnail
+    previous_ids = [user[key] for key in ("avatarId", "avatarThumbnailId") if user.get(key)]
+    if previous_ids:
+        delete_avatar_files({"_id": {"$in": previous_ids}})
+    
+    if Image is not None:
+        thumbnail_executor.submit(generate_avatar_thumbnail, ObjectId(user_id), file_id)
+    
     return jsonify({
         "message": "Avatar uploaded successfully",
-        "avatarUrl": avatar_url
+        "avatarUrl": avatar_url(file_id)
     }), 200
 
+@app.route('/api/avatars/<file_id>', methods=['GET'])
+def get_avatar(file_id):
+    if not ObjectId.is_valid(file_id):
+        return jsonify({"message": "Avatar not found"}), 404
+    
+    try:
+        grid_out = avatar_bucket.open_download_stream(ObjectId(file_id))
+    except gridfs.errors.NoFile:
+        return jsonify({"message": "Avatar not found"}), 404
+    
+    # Stored files never change (a new upload gets a new id), so they can be cached forever
+    if request.if_none_match.contains(file_id):
+        grid_out.close()
+        response = app.response_class(status=304)
+        response.set_etag(file_id)
+        return response
+    
+    length = grid_out.length
+    start, end = 0, length
+    status = 200
+    
+    byte_range = request.range
+    if byte_range and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+        requested = byte_range.range_for_length(length)
+        if requested is None:
+            grid_out.close()
+            response = app.response_class(status=416)
+            response.headers['Content-Range'] = f"bytes */{length}"
+            return response
+        start, end = requested
+        status = 206
+    
+    grid_out.seek(start)
+    
+    def generate():
+        remaining = end - start
+        try:
+            while remaining > 0:
+                chunk = grid_out.read(min(AVATAR_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            grid_out.close()
+    
+    content_type = (grid_out.metadata or {}).get('contentType', 'application/octet-stream')
+    response = Response(generate(), status=status, mimetype=content_type, direct_passthrough=True)
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{length}"
+    response.set_etag(file_id)
+    response.last_modified = grid_out.upload_date
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/api/users/stats', methods=['GET'])
 @jwt_required()
+@admission_control(priority='low')
 def get_user_stats():
     user_id = get_jwt_identity()
     
@@ -584,10 +2101,6 @@ def get_user_stats():
         {"_id": 0, "type": 1, "description": 1, "timestamp": 1}
     ).sort("timestamp", -1).limit(10))
     
-    # Format timestamps
-    for activity in recent_activities:
-        activity["timestamp"] = activity["timestamp"].isoformat()
-    
     stats = {
         "journalEntries": journal_count,
         "meditationMinutes": meditation_minutes,
@@ -598,8 +2111,307 @@ def get_user_stats():
     
     return jsonify(stats), 200
 
+# Data export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 200))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', 64 * 1024))
+export_collections = ['journal_entries', 'mood_entries', 'sessions', 'interaction_logs']
+
+def export_records(user_id):
+    """Yield (type, document) pairs for everything stored about a user"""
+    user = db.users.find_one({"_id": user_id})
+    yield "profile", format_user(user)
+
+    # Chats are exported without their message arrays; messages are unwound
+    # server-side so a long conversation never has to sit in memory at once
+    chats = db.chats.find({"userId": user_id}, {"messages": 0}).batch_size(EXPORT_BATCH_SIZE)
+    for chat in chats:
+        yield "chat", chat
+        messages = db.chats.aggregate([
+            {"$match": {"_id": chat["_id"]}},
+            {"$unwind": "$messages"},
+            {"$replaceRoot": {"newRoot": "$messages"}}
+        ], batchSize=EXPORT_BATCH_SIZE)
+        for message in messages:
+            message["chatId"] = chat["_id"]
+            yield "chat_message", message
+
+    for collection in export_collections:
+        cursor = db[collection].find({"userId": user_id}).batch_size(EXPORT_BATCH_SIZE)
+        for document in cursor:
+            yield collection, document
+
+def export_ndjson(user_id, compress=False):
+    """Stream export records as NDJSON, flushed in bounded chunks"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    for record_type, document in export_records(user_id):
+        buffer += app.json.dumps_bytes({"type": record_type, "data": document})
+        buffer += b"\n"
+        if len(buffer) >= EXPORT_CHUNK_BYTES:
+            chunk = bytes(buffer)
+            buffer.clear()
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = bytes(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+@app.route('/api/users/export', methods=['GET'])
+@jwt_required()
+def export_user_data():
+    user_id = get_jwt_identity()
+    
+    # Find user
+    if not db.users.count_documents({"_id": ObjectId(user_id)}, limit=1):
+        return jsonify({"message": "User not found"}), 404
+    
+    compress = request.args.get('compress') == 'gzip'
+    filename = "mindfulchat-export.ndjson" + (".gz" if compress else "")
+    
+    return Response(
+        stream_with_context(export_ndjson(ObjectId(user_id), compress)),
+        mimetype="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# Mood trends: per-user hourly and daily sentiment/emotion buckets, upserted as
+# messages are analyzed so trends never need to re-scan chats
+mood_granularities = ('hour', 'day')
+mood_indexes_ready = False
+
+def mood_bucket_start(timestamp, granularity):
+    """Truncate a timestamp to the start of its hour or day bucket"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return datetime.datetime.combine(timestamp.date(), datetime.time.min)
+
+def parse_utc_datetime(value):
+    """Parse an ISO 8601 string into a naive UTC datetime, converting any offset"""
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def ensure_mood_indexes():
+    """Create the bucket index once per process"""
+    global mood_indexes_ready
+    if not mood_indexes_ready:
+        db.mood_buckets.create_index(
+            [("userId", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+            unique=True
+        )
+        mood_indexes_ready = True
+
+def record_mood(user_id, sentiment_scores, emotions, timestamp=None):
+    """Add an analyzed message to the user's hourly and daily mood buckets"""
+    if not ObjectId.is_valid(str(user_id)):
+        return
+    timestamp = timestamp or datetime.datetime.utcnow()
+    increments = {
+        "count": 1,
+        "compoundSum": sentiment_scores["compound_score"],
+        f"sentiments.{sentiment_scores['sentiment']}": 1
+    }
+    for emotion, count in emotions.items():
+        increments[f"emotions.{emotion}"] = count
+
+    try:
+        ensure_mood_indexes()
+        db.mood_buckets.bulk_write([
+            UpdateOne(
+                {
+                    "userId": ObjectId(str(user_id)),
+                    "granularity": granularity,
+                    "bucket": mood_bucket_start(timestamp, granularity)
+                },
+                {"$inc": increments},
+                upsert=True
+            )
+            for granularity in mood_granularities
+        ], ordered=False)
+    except Exception as e:
+        logger.error(f"Error recording mood for {user_id}: {str(e)}")
+
+@app.route('/api/users/mood-trend', methods=['GET'])
+@jwt_required()
+@admission_control(priority='low')
+def get_mood_trend():
+    user_id = get_jwt_identity()
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in mood_granularities:
+        return jsonify({"message": "Granularity must be 'hour' or 'day'"}), 400
+    
+    # Date range, defaulting to the last 30 days
+    try:
+        now = datetime.datetime.utcnow()
+        end = request.args.get('to')
+        end = parse_utc_datetime(end) if end else now
+        start = request.args.get('from')
+        start = parse_utc_datetime(start) if start else end - datetime.timedelta(days=30)
+    except ValueError:
+        return jsonify({"message": "Invalid date format"}), 400
+    
+    buckets = db.mood_buckets.find(
+        {
+            "userId": ObjectId(user_id),
+            "granularity": granularity,
+            "bucket": {"$gte": mood_bucket_start(start, granularity), "$lte": end}
+        },
+        {"_id": 0, "bucket": 1, "count": 1, "compoundSum": 1, "sentiments": 1, "emotions": 1}
+    ).sort("bucket", 1)
+    
+    trend = [{
+        "start": bucket["bucket"],
+        "count": bucket["count"],
+        "averageCompound": bucket["compoundSum"] / bucket["count"] if bucket["count"] else 0.0,
+        "sentiments": bucket.get("sentiments", {}),
+        "emotions": bucket.get("emotions", {})
+    } for bucket in buckets]
+    
+    return jsonify({
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "buckets": trend
+    }), 200
+
+# Recurring themes: a Space-Saving sketch of each user's keywords, updated as
+# messages are analyzed so themes never need the user's history re-read
+THEME_SKETCH_SIZE = int(os.environ.get('THEME_SKETCH_SIZE', 64))
+THEME_UPDATE_RETRIES = 3
+theme_indexes_ready = False
+
+class ThemeSketch:
+    """Space-Saving heavy hitters over weighted keyword counts"""
+
+    def __init__(self, capacity, counters=None, total=0):
+        self.capacity = capacity
+        # term -> [count, error]; count overestimates the true count by at most error
+        self.counters = counters or {}
+        self.total = total
+
+    @classmethod
+    def from_document(cls, doc, capacity):
+        if not doc:
+            return cls(capacity)
+        counters = {term: [count, error] for term, count, error in doc["terms"]}
+        sketch = cls(capacity, counters, doc["total"])
+        # Shrink a sketch stored under a larger capacity
+        while len(sketch.counters) > capacity:
+            del sketch.counters[min(sketch.counters, key=lambda term: sketch.counters[term][0])]
+        return sketch
+
+    def add(self, term, count=1):
+        self.total += count
+        counter = self.counters.get(term)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[term] = [count, 0]
+        else:
+            # Replace the smallest counter, inheriting its count as the error bound
+            smallest = min(self.counters, key=lambda term: self.counters[term][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[term] = [floor + count, floor]
+
+    def top(self, k):
+        return heapq.nlargest(k, self.counters.items(), key=lambda item: item[1][0])
+
+    def to_terms(self):
+        """Compact storage form: a list of [term, count, error] triples"""
+        return [[term, count, error] for term, (count, error) in self.counters.items()]
+
+def ensure_theme_indexes():
+    """Create the per-user sketch index once per process"""
+    global theme_indexes_ready
+    if not theme_indexes_ready:
+        db.user_themes.create_index("userId", unique=True)
+        theme_indexes_ready = True
+
+def record_themes(user_id, word_freq):
+    """Fold an analyzed message's keyword counts into the user's theme sketch
+
+    This is a read-modify-write with retries, so request handlers run it with
+    run_in_background rather than on the request path.
+    """
+    if not word_freq or not ObjectId.is_valid(str(user_id)):
+        return
+    user_oid = ObjectId(str(user_id))
+    
+    try:
+        ensure_theme_indexes()
+        # Optimistic concurrency: retry if another request updated the sketch first
+        for _ in range(THEME_UPDATE_RETRIES):
+            doc = db.user_themes.find_one({"userId": user_oid})
+            sketch = ThemeSketch.from_document(doc, THEME_SKETCH_SIZE)
+            for term, count in word_freq.items():
+                sketch.add(term, count)
+            fields = {"terms": sketch.to_terms(), "total": sketch.total, "updatedAt": datetime.datetime.utcnow()}
+            
+            if doc is None:
+                try:
+                    db.user_themes.insert_one({"userId": user_oid, "version": 1, **fields})
+                    return
+                except DuplicateKeyError:
+                    continue
+            
+            result = db.user_themes.update_one(
+                {"_id": doc["_id"], "version": doc["version"]},
+                {"$set": fields, "$inc": {"version": 1}}
+            )
+            if result.modified_count:
+                return
+        logger.warning(f"Gave up recording themes for {user_id} after {THEME_UPDATE_RETRIES} conflicts")
+    except Exception as e:
+        logger.error(f"Error recording themes for {user_id}: {str(e)}")
+
+@app.route('/api/users/themes', methods=['GET'])
+@jwt_required()
+@admission_control(priority='low')
+def get_user_themes():
+    user_id = get_jwt_identity()
+    
+    try:
+        limit = min(int(request.args.get('limit', 10)), THEME_SKETCH_SIZE)
+    except ValueError:
+        return jsonify({"message": "Limit must be a number"}), 400
+    
+    doc = db.user_themes.find_one({"userId": ObjectId(user_id)})
+    etag = make_etag(user_id, doc["version"] if doc else 0, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    sketch = ThemeSketch.from_document(doc, THEME_SKETCH_SIZE)
+    themes = [{
+        "term": term,
+        "count": count,
+        # Occurrences the sketch can vouch for, however many terms it evicted
+        "minCount": count - error
+    } for term, (count, error) in sketch.top(limit)]
+    
+    return tag_response(jsonify({
+        "themes": themes,
+        "totalKeywords": sketch.total,
+        "updatedAt": doc["updatedAt"] if doc else None
+    }), etag), 200
+
+def bump_chat_list_version(*user_ids):
+    """Invalidate the chat-list ETags of the given users after their chats change"""
+    if user_ids:
+        db.users.update_many(
+            {"_id": {"$in": [ObjectId(str(user_id)) for user_id in user_ids]}},
+            {"$inc": {"chatListVersion": 1}}
+        )
+
 @app.route('/api/chats', methods=['GET'])
 @jwt_required()
+@admission_control(priority='low')
 def get_chat_history():
     user_id = get_jwt_identity()
     
@@ -627,20 +2439,29 @@ def get_chat_history():
         end_of_day = datetime.datetime.combine(date_obj.date(), datetime.time.max)
         query["createdAt"] = {"$gte": start_of_day, "$lte": end_of_day}
     
-    # Get chats
+    # Every chat write bumps the user's chat-list version, so repeat polls are
+    # answered from one primary-key read without touching the chats
+    user = db.users.find_one({"_id": ObjectId(user_id)}, {"chatListVersion": 1}) or {}
+    etag = make_etag(user_id, page, limit, search, date_filter, user.get("chatListVersion", 0))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
     total = db.chats.count_documents(query)
+    
+    # Get chats
     chats = list(db.chats.find(query).sort("updatedAt", -1).skip(skip).limit(limit))
     
     # Format chats
     formatted_chats = [format_chat(chat) for chat in chats]
     
-    return jsonify({
+    return tag_response(jsonify({
         "chats": formatted_chats,
         "total": total,
         "page": page,
         "limit": limit,
         "totalPages": (total + limit - 1) // limit
-    }), 200
+    }), etag), 200
 
 @app.route('/api/chats/<chat_id>', methods=['GET'])
 @jwt_required()
@@ -648,21 +2469,192 @@ def get_chat(chat_id):
     user_id = get_jwt_identity()
     
     try:
-        # Find chat
-        chat = db.chats.find_one({
+        query = {
             "_id": ObjectId(chat_id),
             "userId": ObjectId(user_id)
-        })
+        }
+        
+        # Check the version first so an unchanged chat is never loaded
+        version = db.chats.find_one(query, {"updatedAt": 1, "version": 1})
+        
+        if not version:
+            return jsonify({"message": "Chat not found"}), 404
+        
+        etag = make_etag(chat_id, version.get("updatedAt"), version.get("version", 0))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Find chat
+        chat = db.chats.find_one(query)
         
         if not chat:
             return jsonify({"message": "Chat not found"}), 404
         
-        return jsonify(format_chat(chat)), 200
+        return tag_response(jsonify(format_chat(chat)), etag), 200
     except Exception as e:
         return jsonify({"message": str(e)}), 400
 
+# Per-chat conversation state: a bounded LRU holding each chat's owner, running
+# sentiment and the emotions of its last few user messages, so replies can use
+# context and send_message never has to re-read the chat to check ownership
+CHAT_STATE_CACHE_SIZE = int(os.environ.get('CHAT_STATE_CACHE_SIZE', 1024))
+CHAT_STATE_RECENT_MESSAGES = int(os.environ.get('CHAT_STATE_RECENT_MESSAGES', 10))
+CHAT_STATE_SENTIMENT_ALPHA = 0.3
+
+class ChatStateCache:
+    """LRU of conversation state keyed by chat id"""
+
+    def __init__(self, max_entries, recent_messages):
+        self.max_entries = max_entries
+        self.recent_messages = recent_messages
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def new_state(self, user_id):
+        return {
+            "userId": user_id,
+            "runningSentiment": 0.0,
+            "recentEmotions": deque(maxlen=self.recent_messages)
+        }
+
+    def get(self, chat_id, user_id):
+        """Return a copy of the chat's state, loading it on first access, or None if the user doesn't own it"""
+        with self.lock:
+            state = self.entries.get(chat_id)
+            if state is not None:
+                self.entries.move_to_end(chat_id)
+                self.hits += 1
+                return self.copy(state) if state["userId"] == user_id else None
+            self.misses += 1
+        
+        # One round trip for the owner check and the recent user messages
+        loaded = list(db.chats.aggregate([
+            {"$match": {"_id": ObjectId(chat_id), "userId": ObjectId(user_id)}},
+            {"$project": {
+                "recent": {"$slice": [
+                    {"$filter": {
+                        "input": "$messages", "as": "message",
+                        "cond": {"$eq": ["$$message.role", "user"]}
+                    }},
+                    -self.recent_messages
+                ]}
+            }}
+        ]))
+        if not loaded:
+            return None
+        
+        state = self.new_state(user_id)
+        for message in loaded[0].get("recent") or []:
+            self.add_user_message(state, message.get("content") or "")
+        self.put(chat_id, state)
+        return self.copy(state)
+
+    @staticmethod
+    def add_user_message(state, content, sentiment=None, emotions=None):
+        """Fold one user message into the running sentiment and recent emotions"""
+        if sentiment is None:
+            sentiment = sentiment_analysis(content)
+        if emotions is None:
+            emotions = detect_emotions(content)
+        state["runningSentiment"] = (
+            CHAT_STATE_SENTIMENT_ALPHA * sentiment["compound_score"]
+            + (1 - CHAT_STATE_SENTIMENT_ALPHA) * state["runningSentiment"]
+        )
+        state["recentEmotions"].append(emotions)
+
+    def record_exchange(self, chat_id, user_id, sentiment, emotions):
+        """Update a chat's state after a user message and its reply have been written"""
+        with self.lock:
+            state = self.entries.get(chat_id) or self.new_state(user_id)
+            self.add_user_message(state, None, sentiment, emotions)
+            self.entries[chat_id] = state
+            self.entries.move_to_end(chat_id)
+            self.evict()
+
+    def put(self, chat_id, state):
+        with self.lock:
+            self.entries[chat_id] = state
+            self.entries.move_to_end(chat_id)
+            self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, chat_id):
+        with self.lock:
+            self.entries.pop(chat_id, None)
+
+    def discard_user(self, user_id):
+        with self.lock:
+            for chat_id in [key for key, state in self.entries.items() if state["userId"] == user_id]:
+                del self.entries[chat_id]
+
+    @staticmethod
+    def copy(state):
+        return {**state, "recentEmotions": list(state["recentEmotions"])}
+
+    def snapshot(self):
+        with self.lock:
+            return {"entries": len(self.entries), "maxEntries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+chat_states = ChatStateCache(CHAT_STATE_CACHE_SIZE, CHAT_STATE_RECENT_MESSAGES)
+
+def generate_chat_reply(sentiment, emotions, state=None):
+    """Reply to a chat message, using the conversation state when there is one"""
+    # Generate response based on sentiment
+    if sentiment["sentiment"] == 'positive':
+        ai_response = "I'm glad you're feeling positive! How can I help you further?"
+    elif sentiment["sentiment"] == 'negative':
+        ai_response = "I'm sorry to hear you're feeling this way. Would you like to talk about it more or explore some coping strategies?"
+    else:
+        ai_response = "Thank you for sharing. Is there anything specific you'd like to discuss or learn about?"
+    
+    if not state:
+        return ai_response
+    
+    # Acknowledge a lift in mood compared to earlier in the conversation
+    if sentiment["sentiment"] == 'positive' and state["runningSentiment"] <= -0.05:
+        return "It's good to hear things feel a bit brighter than earlier in our conversation. What's helped?"
+    
+    # Point out an emotion that keeps coming up and offer a strategy for it
+    emotion_counts = {}
+    for recent in state["recentEmotions"] + [emotions]:
+        for emotion in recent:
+            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+    recurring = [emotion for emotion in emotions if emotion_counts[emotion] >= 2]
+    if sentiment["sentiment"] == 'negative' and recurring:
+        emotion = max(recurring, key=emotion_counts.get)
+        strategies = coping_strategies.get(emotion, coping_strategies['stress'])
+        ai_response = (
+            f"I've noticed {emotion} has come up a few times while we've been talking. "
+            f"Here's a strategy that might help: {random.choice(strategies)}"
+        )
+    
+    return ai_response
+
+def finish_chat_analysis(chat_id, user_id, exchange, messages, summarize):
+    """Analyze a crisis chat message after its reply has been sent"""
+    user_message = exchange[0]["content"]
+    sentiment = sentiment_analysis(user_message)
+    emotions = detect_emotions(user_message)
+    record_mood(user_id, sentiment, emotions)
+    record_themes(user_id, count_keywords(user_message))
+    chat_states.record_exchange(chat_id, user_id, sentiment, emotions)
+    if summarize:
+        db.chats.update_one(
+            {"_id": ObjectId(chat_id)},
+            {"$set": {"summary": generate_chat_summary(messages)}, "$inc": {"version": 1}}
+        )
+        bump_chat_list_version(user_id)
+
 @app.route('/api/chats/message', methods=['POST'])
 @jwt_required()
+@admission_control(priority='high', rate_limited=True, crisis_lane=True)
 def send_message():
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -676,33 +2668,35 @@ def send_message():
     # Check if continuing existing chat
     chat_id = data.get('chatId')
     
+    chat_state = None
     if chat_id:
-        try:
-            # Find existing chat
-            chat = db.chats.find_one({
-                "_id": ObjectId(chat_id),
-                "userId": ObjectId(user_id)
-            })
-            
-            if not chat:
-                return jsonify({"message": "Chat not found"}), 404
-        except:
+        if not ObjectId.is_valid(chat_id):
             return jsonify({"message": "Invalid chat ID"}), 400
+        
+        # Check ownership from the cached conversation state
+        chat_state = chat_states.get(chat_id, user_id)
+        
+        if not chat_state:
+            return jsonify({"message": "Chat not found"}), 404
     
     # Process message with AI
     # In a real app, you would call your AI service here
     # For this example, we'll use a simple response
     
-    # Analyze sentiment
-    sentiment = simple_sentiment_analysis(user_message)
-    
-    # Generate response based on sentiment
-    if sentiment["sentiment"] == 'positive':
-        ai_response = "I'm glad you're feeling positive! How can I help you further?"
-    elif sentiment["sentiment"] == 'negative':
-        ai_response = "I'm sorry to hear you're feeling this way. Would you like to talk about it more or explore some coping strategies?"
+    if g.get('crisis'):
+        # Crisis fast path: reply straight away, analysis happens after the write
+        ai_response = random.choice(response_templates['crisis'])
     else:
-        ai_response = "Thank you for sharing. Is there anything specific you'd like to discuss or learn about?"
+        # Analyze sentiment
+        sentiment = sentiment_analysis(user_message)
+        emotions = detect_emotions(user_message)
+        
+        # Track mood and recurring themes over time
+        record_mood(user_id, sentiment, emotions)
+        run_in_background(record_themes, user_id, count_keywords(user_message))
+        
+        # Generate response based on sentiment and conversation context
+        ai_response = generate_chat_reply(sentiment, emotions, chat_state)
     
     # Create message objects
     timestamp = datetime.datetime.utcnow()
@@ -720,25 +2714,41 @@ def send_message():
     
     # Update or create chat
     if chat_id:
-        # Update existing chat
-        db.chats.update_one(
-            {"_id": ObjectId(chat_id)},
+        # Update existing chat and get it back in the same round trip
+        updated_chat = db.chats.find_one_and_update(
+            {"_id": ObjectId(chat_id), "userId": ObjectId(user_id)},
             {
                 "$push": {"messages": {"$each": [user_message_obj, ai_message_obj]}},
-                "$set": {"updatedAt": timestamp}
-            }
+                "$set": {"updatedAt": timestamp},
+                "$inc": {"version": 1}
+            },
+            return_document=ReturnDocument.AFTER
         )
         
-        # Get updated chat
-        updated_chat = db.chats.find_one({"_id": ObjectId(chat_id)})
+        if not updated_chat:
+            # Deleted since its state was cached
+            chat_states.discard(chat_id)
+            return jsonify({"message": "Chat not found"}), 404
+        
+        bump_chat_list_version(user_id)
+        
+        if g.get('crisis'):
+            # State, mood and summary are updated in the background
+            run_in_background(
+                finish_chat_analysis, chat_id, user_id, [user_message_obj, ai_message_obj],
+                updated_chat["messages"], len(updated_chat["messages"]) % 5 == 0
+            )
+        else:
+            chat_states.record_exchange(chat_id, user_id, sentiment, emotions)
         
         # Update summary if needed
-        if len(updated_chat["messages"]) % 5 == 0:  # Update summary every 5 messages
+        if not g.get('crisis') and len(updated_chat["messages"]) % 5 == 0:  # Update summary every 5 messages
             summary = generate_chat_summary(updated_chat["messages"])
             db.chats.update_one(
                 {"_id": ObjectId(chat_id)},
-                {"$set": {"summary": summary}}
+                {"$set": {"summary": summary}, "$inc": {"version": 1}}
             )
+            bump_chat_list_version(user_id)
             updated_chat["summary"] = summary
         
         chat_response = format_chat(updated_chat)
@@ -752,19 +2762,25 @@ def send_message():
             "title": title,
             "messages": [user_message_obj, ai_message_obj],
             "createdAt": timestamp,
-            "updatedAt": timestamp
+            "updatedAt": timestamp,
+            "version": 1
         }
         
         # Generate summary
-        summary = generate_chat_summary([user_message_obj, ai_message_obj])
-        new_chat["summary"] = summary
+        if not g.get('crisis'):
+            new_chat["summary"] = generate_chat_summary([user_message_obj, ai_message_obj])
         
-        # Insert new chat
-        result = db.chats.insert_one(new_chat)
-        
-        # Get created chat
-        created_chat = db.chats.find_one({"_id": result.inserted_id})
-        chat_response = format_chat(created_chat)
+        # Insert new chat (insert_one fills in new_chat["_id"], so no re-read is needed)
+        db.chats.insert_one(new_chat)
+        bump_chat_list_version(user_id)
+        if g.get('crisis'):
+            run_in_background(
+                finish_chat_analysis, str(new_chat["_id"]), user_id, [user_message_obj, ai_message_obj],
+                new_chat["messages"], True
+            )
+        else:
+            chat_states.record_exchange(str(new_chat["_id"]), user_id, sentiment, emotions)
+        chat_response = format_chat(new_chat)
     
     # Log interaction
     interaction_log = {
@@ -795,11 +2811,146 @@ def delete_chat(chat_id):
         if result.deleted_count == 0:
             return jsonify({"message": "Chat not found"}), 404
         
+        chat_states.discard(chat_id)
+        bump_chat_list_version(user_id)
+        
         return jsonify({"message": "Chat deleted successfully"}), 200
     except Exception as e:
         return jsonify({"message": str(e)}), 400
 
+# Incremental journal analysis: entries are analyzed per paragraph and the
+# results cached on the entry, keyed by a hash of each paragraph's text
+paragraph_separator = re.compile(r'\n\s*\n')
+sentiment_score_keys = ('compound_score', 'positive_score', 'negative_score', 'neutral_score')
+
+def split_paragraphs(text):
+    return [paragraph.strip() for paragraph in paragraph_separator.split(text) if paragraph.strip()]
+
+def paragraph_hash(paragraph, language, mode):
+    """Hash a paragraph together with the settings its analysis depends on"""
+    return hashlib.sha1(f"{language}|{mode or SENTIMENT_MODE}|{paragraph}".encode('utf-8')).hexdigest()
+
+def analyze_paragraph(paragraph, mode=None, language='english'):
+    """Analyze one paragraph into a cacheable record with its word weight and keyword counts"""
+    record = {key: 0.0 for key in sentiment_score_keys}
+    record.update({"weight": 0, "emotions": {}, "is_crisis": False, "keywordCounts": {}})
+    
+    chunks = iter_sentence_chunks(paragraph, language)
+    for results, word_freq in iter_chunk_results(chunks, mode, language=language):
+        for result in results:
+            record["weight"] += result["weight"]
+            for key in sentiment_score_keys:
+                record[key] += result[key] * result["weight"]
+            for emotion, count in result["emotions"].items():
+                record["emotions"][emotion] = record["emotions"].get(emotion, 0) + count
+            record["is_crisis"] = record["is_crisis"] or result["is_crisis"]
+        for word, count in word_freq.items():
+            record["keywordCounts"][word] = record["keywordCounts"].get(word, 0) + count
+    
+    for key in sentiment_score_keys:
+        record[key] = record[key] / record["weight"] if record["weight"] else 0.0
+    if not record["weight"]:
+        record["neutral_score"] = 1.0
+    
+    if record["compound_score"] >= 0.05:
+        record["sentiment"] = 'positive'
+    elif record["compound_score"] <= -0.05:
+        record["sentiment"] = 'negative'
+    else:
+        record["sentiment"] = 'neutral'
+    return record
+
+def analyze_journal_content(content, cached_paragraphs=None, mode=None, language=None):
+    """
+    Analyze journal text paragraph by paragraph, reusing cached paragraph
+    results whose hash is unchanged; returns the merged analysis, the new
+    paragraph records and how many paragraphs were re-analyzed
+    """
+    language = language or detect_language(content)
+    cache = {record["hash"]: record for record in cached_paragraphs or []}
+    
+    records = []
+    reanalyzed = 0
+    for paragraph in split_paragraphs(content):
+        digest = paragraph_hash(paragraph, language, mode)
+        record = cache.get(digest)
+        if record is None:
+            record = analyze_paragraph(paragraph, mode, language)
+            record["hash"] = digest
+            cache[digest] = record
+            reanalyzed += 1
+        records.append(record)
+    
+    analysis = aggregate_sentence_results(
+        (([record], record["keywordCounts"]) for record in records), include_sentences=False
+    )
+    analysis["language"] = language
+    return analysis, records, reanalyzed
+
+@app.route('/api/journal/<entry_id>/analyze', methods=['POST'])
+@jwt_required()
+@admission_control(priority='normal')
+def analyze_journal_entry(entry_id):
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    # Validate input
+    if not data or 'content' not in data:
+        return jsonify({"message": "Content is required"}), 400
+    if not isinstance(data['content'], str):
+        return jsonify({"message": "Content must be a string"}), 400
+    
+    try:
+        query = {"_id": ObjectId(entry_id), "userId": ObjectId(user_id)}
+    except Exception:
+        return jsonify({"message": "Invalid entry ID"}), 400
+    
+    # Only the cached paragraph results are needed, not the entry itself
+    entry = db.journal_entries.find_one(query, {"paragraphAnalysis": 1})
+    
+    if not entry:
+        return jsonify({"message": "Journal entry not found"}), 404
+    
+    language = resolve_language(data.get('language'), data['content'])
+    if language is None:
+        return jsonify({"message": "Unsupported language"}), 400
+    
+    analysis, records, reanalyzed = analyze_journal_content(
+        data['content'], entry.get("paragraphAnalysis"), data.get('sentimentMode'), language
+    )
+    analysis["analyzedAt"] = datetime.datetime.utcnow()
+    
+    db.journal_entries.update_one(query, {"$set": {"analysis": analysis, "paragraphAnalysis": records}})
+    
+    # Only paragraphs that weren't in the entry before count towards themes,
+    # so re-analyzing an edited entry doesn't count its unchanged text twice
+    previous = {record["hash"] for record in entry.get("paragraphAnalysis") or []}
+    new_counts = {}
+    for record in records:
+        if record["hash"] not in previous:
+            previous.add(record["hash"])
+            for word, count in record["keywordCounts"].items():
+                new_counts[word] = new_counts.get(word, 0) + count
+    run_in_background(record_themes, user_id, new_counts)
+    
+    return jsonify({
+        "analysis": analysis,
+        "paragraphs": [
+            {
+                "hash": record["hash"],
+                "sentiment": record["sentiment"],
+                "compound_score": record["compound_score"],
+                "emotions": record["emotions"],
+                "is_crisis": record["is_crisis"]
+            }
+            for record in records
+        ],
+        "reanalyzed": reanalyzed,
+        "reused": len(records) - reanalyzed
+    }), 200
+
 @app.route('/api/analyze', methods=['POST'])
+@admission_control(priority='normal')
 def analyze_sentiment():
     try:
         data = request.json
@@ -808,17 +2959,28 @@ def analyze_sentiment():
         if not message:
             return jsonify({'error': 'No message provided'}), 400
         
-        # Simple sentiment analysis
-        sentiment_scores = simple_sentiment_analysis(message)
+        # Detect language unless the client provides it
+        language = resolve_language(data.get('language'), message)
+        if language is None:
+            return jsonify({'error': 'Unsupported language'}), 400
+        
+        # Long entries are analyzed sentence by sentence
+        if data.get('longText'):
+            result = analyze_long_text(message, data.get('sentimentMode'), bool(data.get('parallel')), language)
+            logger.info(f"Analyzed long text: {result['sentiment']} over {len(result['sentences'])} sentences")
+            return jsonify(result)
+        
+        # Sentiment analysis
+        sentiment_scores = sentiment_analysis(message, data.get('sentimentMode'), language)
         
         # Extract keywords
-        keywords = extract_keywords(message)
+        keywords = extract_keywords(message, language=language)
         
         # Detect emotions
         emotions = detect_emotions(message)
         
         # Check for crisis keywords
-        is_crisis = any(keyword in message.lower() for keyword in crisis_keywords)
+        is_crisis = detect_crisis(message, language)
         
         result = {
             'sentiment': sentiment_scores['sentiment'],
@@ -828,7 +2990,8 @@ def analyze_sentiment():
             'neutral_score': sentiment_scores['neutral_score'],
             'keywords': keywords,
             'emotions': emotions,
-            'is_crisis': is_crisis
+            'is_crisis': is_crisis,
+            'language': language
         }
         
         logger.info(f"Analyzed sentiment: {sentiment_scores['sentiment']} (score: {sentiment_scores['compound_score']})")
@@ -839,6 +3002,7 @@ def analyze_sentiment():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/process', methods=['POST'])
+@admission_control(priority='high', rate_limited=True, crisis_lane=True)
 def process_message():
     try:
         data = request.json
@@ -849,19 +3013,40 @@ def process_message():
         if not message:
             return jsonify({'error': 'No message provided'}), 400
         
-        # Simple sentiment analysis
-        sentiment_scores = simple_sentiment_analysis(message)
+        # Detect language unless the client provides it
+        language = resolve_language(data.get('language'), message)
+        if language is None:
+            return jsonify({'error': 'Unsupported language'}), 400
+        
+        # Crisis fast path: reply from precomputed data, analyze afterwards
+        if g.get('crisis'):
+            run_in_background(finish_message_analysis, message, user_id, language, data.get('sentimentMode'))
+            logger.info(f"Processed crisis message from {user_id} on the fast path")
+            return jsonify({
+                'response': random.choice(response_templates['crisis']),
+                'resources': crisis_resources,
+                'sentiment': 'negative',
+                'is_crisis': True,
+                'keywords': [],
+                'emotions': {},
+                'language': language,
+                'analysisPending': True
+            })
+        
+        # Sentiment analysis
+        sentiment_scores = sentiment_analysis(message, data.get('sentimentMode'), language)
         sentiment = sentiment_scores['sentiment']
         
         # Extract keywords
-        keywords = extract_keywords(message)
+        word_freq = count_keywords(message, language)
+        keywords = top_keywords(word_freq)
         
         # Detect emotions
         emotions = detect_emotions(message)
         
         # Check for crisis keywords if not already provided
         if not is_crisis:
-            is_crisis = any(keyword in message.lower() for keyword in crisis_keywords)
+            is_crisis = detect_crisis(message, language)
         
         # Determine primary emotion
         primary_emotion = None
@@ -871,11 +3056,17 @@ def process_message():
         else:
             primary_emotion = None
         
+        # Track mood and recurring themes over time for signed-in users
+        record_mood(user_id, sentiment_scores, emotions)
+        run_in_background(record_themes, user_id, word_freq)
+        
         # Generate response based on sentiment and context
         response = generate_response(message, sentiment, primary_emotion, is_crisis)
         
         # Get relevant resources
-        relevant_resources = get_relevant_resources(message, sentiment, primary_emotion, is_crisis, keywords)
+        relevant_resources = get_relevant_resources(
+            message, sentiment, primary_emotion, is_crisis, keywords, data.get('resourceRanking')
+        )
         
         result = {
             'response': response,
@@ -883,7 +3074,8 @@ def process_message():
             'sentiment': sentiment,
             'is_crisis': is_crisis,
             'keywords': keywords,
-            'emotions': emotions
+            'emotions': emotions,
+            'language': language
         }
         
         # Log the interaction
@@ -899,6 +3091,20 @@ def process_message():
             'resources': get_relevant_resources("", "neutral", None, False, [])
         }), 500
 
+def finish_message_analysis(message, user_id, language=None, sentiment_mode=None):
+    """Run the analysis skipped by the crisis fast path and record its results"""
+    language = language or detect_language(message)
+    sentiment_scores = sentiment_analysis(message, sentiment_mode, language)
+    word_freq = count_keywords(message, language)
+    keywords = top_keywords(word_freq)
+    emotions = detect_emotions(message)
+    record_mood(user_id, sentiment_scores, emotions)
+    record_themes(user_id, word_freq)
+    logger.info(
+        f"Finished crisis analysis for {user_id}: sentiment={sentiment_scores['sentiment']}, "
+        f"keywords={keywords}, emotions={emotions}"
+    )
+
 def generate_response(message, sentiment, primary_emotion=None, is_crisis=False):
     # Check for greeting patterns
     greeting_words = ['hello', 'hi', 'hey', 'greetings', 'good morning', 'good afternoon', 'good evening']
@@ -948,10 +3154,13 @@ def generate_response(message, sentiment, primary_emotion=None, is_crisis=False)
 
     return base_response + coping_strategy
 
-def get_relevant_resources(message, sentiment, primary_emotion=None, is_crisis=False, keywords=None):
+def get_relevant_resources(message, sentiment, primary_emotion=None, is_crisis=False, keywords=None, ranking=None):
     if keywords is None:
         keywords = []
     
+    if (ranking or RESOURCE_RANKING) == 'tfidf':
+        return get_ranked_resources(message, sentiment, primary_emotion, is_crisis)
+    
     # Filter resources based on keywords and emotion
     relevant_resources = []
     
@@ -979,24 +3188,48 @@ def get_relevant_resources(message, sentiment, primary_emotion=None, is_crisis=F
     
     # If no relevant resources found, add general resources based on sentiment
     if not relevant_resources:
-        if sentiment == 'negative':
-            # Add resources for common negative emotions
-            negative_tags = ['anxiety', 'depression', 'stress', 'sadness']
-            for resource in resources_data:
-                resource_tags = [tag.lower() for tag in resource.get('tags', [])]
-                if any(tag in resource_tags for tag in negative_tags):
-                    relevant_resources.append(resource)
-        else:
-            # Add general wellbeing resources
-            wellbeing_tags = ['mindfulness', 'self-care', 'meditation']
-            for resource in resources_data:
-                resource_tags = [tag.lower() for tag in resource.get('tags', [])]
-                if any(tag in resource_tags for tag in wellbeing_tags):
-                    relevant_resources.append(resource)
+        relevant_resources = get_default_resources(sentiment)
     
     # Limit to top 3 resources
     return relevant_resources[:3]
 
+def get_ranked_resources(message, sentiment, primary_emotion=None, is_crisis=False, limit=3):
+    """Relevance-ordered resources from the TF-IDF index, crisis resources first"""
+    relevant_resources = []
+    if is_crisis:
+        relevant_resources = [r for r in resources_data if 'crisis' in [tag.lower() for tag in r.get('tags', [])]]
+    
+    # The detected emotion is added to the query so "can't stop worrying" still finds anxiety resources
+    query = f"{message} {primary_emotion}" if primary_emotion else message
+    for resource, score in resource_index.top_k(query, limit + len(relevant_resources)):
+        if resource not in relevant_resources:
+            relevant_resources.append(resource)
+    
+    if not relevant_resources:
+        relevant_resources = get_default_resources(sentiment)
+    
+    return relevant_resources[:limit]
+
+def get_default_resources(sentiment):
+    """General resources based on sentiment when nothing specific matches"""
+    relevant_resources = []
+    if sentiment == 'negative':
+        # Add resources for common negative emotions
+        negative_tags = ['anxiety', 'depression', 'stress', 'sadness']
+        for resource in resources_data:
+            resource_tags = [tag.lower() for tag in resource.get('tags', [])]
+            if any(tag in resource_tags for tag in negative_tags):
+                relevant_resources.append(resource)
+    else:
+        # Add general wellbeing resources
+        wellbeing_tags = ['mindfulness', 'self-care', 'meditation']
+        for resource in resources_data:
+            resource_tags = [tag.lower() for tag in resource.get('tags', [])]
+            if any(tag in resource_tags for tag in wellbeing_tags):
+                relevant_resources.append(resource)
+    
+    return relevant_resources
+
 def format_user(user):
     """Format user document for response"""
     if user:
@@ -1006,6 +3239,7 @@ def format_user(user):
             "email": user["email"],
             "createdAt": user["createdAt"],
             "avatar": user.get("avatar"),
+            "avatarThumbnail": user.get("avatarThumbnail"),
             "bio": user.get("bio"),
             "preferences": user.get("preferences", {})
         }
@@ -1025,19 +3259,20 @@ def format_chat(chat):
         }
     return None
 
-def generate_chat_summary(messages):
+def analyze_chat_messages(messages, detailed=False):
+    """Analyze a chat's user messages one at a time instead of joining them into one string"""
+    user_chunks = ([(0, msg["content"])] for msg in messages if msg["role"] == "user")
+    return aggregate_sentence_results(
+        iter_chunk_results(user_chunks, detailed=detailed), include_sentences=False
+    )
+
+def generate_chat_summary(messages, analysis=None):
     """Generate a summary for a chat conversation"""
     if not messages or len(messages) < 2:
         return "Brief conversation"
     
-    # Combine user messages
-    user_text = " ".join([msg["content"] for msg in messages if msg["role"] == "user"])
-    
-    # Extract keywords
-    keywords = extract_keywords(user_text)
-    
-    # Analyze sentiment
-    sentiment = simple_sentiment_analysis(user_text)
+    sentiment = analysis or analyze_chat_messages(messages)
+    keywords = sentiment["keywords"]
     
     # Determine overall sentiment
     if sentiment["compound_score"] >= 0.05:
@@ -1054,6 +3289,131 @@ def generate_chat_summary(messages):
     else:
         return f"Conversation with {sentiment_label} sentiment"
 
+# Offline re-analysis: `flask --app app reanalyze` recomputes chat summaries
+# and stored analysis after lexicon or summary logic changes
+def reanalyze_document(collection, document):
+    """Recompute the stored analysis fields for one chat or journal entry"""
+    analyzed_at = datetime.datetime.utcnow()
+    if collection == 'chats':
+        messages = document.get("messages", [])
+        analysis = analyze_chat_messages(messages, detailed=True)
+        analysis["analyzedAt"] = analyzed_at
+        return document["_id"], {
+            "summary": generate_chat_summary(messages, analysis),
+            "analysis": analysis
+        }
+
+    # Re-analyze every paragraph from scratch, refreshing the paragraph cache too
+    analysis, records, _ = analyze_journal_content(document.get("content", ""))
+    analysis["analyzedAt"] = analyzed_at
+    return document["_id"], {"analysis": analysis, "paragraphAnalysis": records}
+
+def read_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            value = f.read().strip()
+        if ObjectId.is_valid(value):
+            return ObjectId(value)
+    return None
+
+def write_checkpoint(path, last_id):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(last_id))
+    os.replace(tmp_path, path)
+
+@app.cli.command('reanalyze')
+@click.option('--collection', type=click.Choice(['chats', 'journal_entries']), default='chats',
+              help='Collection to re-analyze.')
+@click.option('--batch-size', default=500, show_default=True, help='Documents read and written per batch.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Analysis processes.')
+@click.option('--checkpoint', default=None, help='Checkpoint file (default: reanalyze_<collection>.checkpoint).')
+@click.option('--restart', is_flag=True, help='Ignore any existing checkpoint.')
+@click.option('--dry-run', is_flag=True, help='Analyze without writing results or checkpoints.')
+def reanalyze_command(collection, batch_size, workers, checkpoint, restart, dry_run):
+    """Re-run summaries and analysis over stored chats or journal entries"""
+    checkpoint = checkpoint or f"reanalyze_{collection}.checkpoint"
+    last_id = None if restart else read_checkpoint(checkpoint)
+    if last_id:
+        click.echo(f"Resuming {collection} after {last_id}")
+
+    if collection == 'chats':
+        projection = {"userId": 1, "messages.role": 1, "messages.content": 1}
+    else:
+        projection = {"content": 1}
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    processed = 0
+    written = 0
+    started = time.monotonic()
+    try:
+        while True:
+            # Page by _id so every batch is an index range scan and the run can resume
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            batch = list(db[collection].find(query, projection).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+
+            if executor:
+                results = executor.map(reanalyze_document, repeat(collection), batch,
+                                       chunksize=max(1, len(batch) // (workers * 4)))
+            else:
+                results = map(reanalyze_document, repeat(collection), batch)
+            # Chats carry a version for their ETags, so rewritten summaries must bump it
+            update_extra = {"$inc": {"version": 1}} if collection == 'chats' else {}
+            operations = [UpdateOne({"_id": _id}, {"$set": fields, **update_extra}) for _id, fields in results]
+
+            if not dry_run:
+                result = db[collection].bulk_write(operations, ordered=False)
+                written += result.modified_count
+                if collection == 'chats':
+                    bump_chat_list_version(*{document["userId"] for document in batch})
+
+            last_id = batch[-1]["_id"]
+            processed += len(batch)
+            if not dry_run:
+                write_checkpoint(checkpoint, last_id)
+
+            elapsed = time.monotonic() - started
+            click.echo(f"{processed} {collection} analyzed, {written} updated ({processed / elapsed:.1f} docs/s)")
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if not dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    elapsed = time.monotonic() - started
+    mode = " (dry run)" if dry_run else ""
+    click.echo(f"Done{mode}: {processed} {collection} analyzed in {elapsed:.1f}s")
+
+# Regression cases for the rule-based analysis: (description, check, expected)
+analysis_checks = [
+    ('"anxius" is corrected to anxious', lambda: 'anxiety' in detect_emotions("I feel anxius"), True),
+    ('"depresed" reads as negative', lambda: simple_sentiment_analysis("I feel anxius and depresed")["sentiment"], 'negative'),
+    ('"suicidal thougts" is a crisis', lambda: detect_crisis("i have suicidal thougts"), True),
+    ('"suicde" is a crisis', lambda: detect_crisis("thinking about suicde"), True),
+    ('"given up smoking" is not a crisis', lambda: detect_crisis("I have given up smoking"), False),
+    ('"shared" stays shared', lambda: detect_emotions("I shared a meal with my family"), {}),
+    ('"turned out" stays turned', lambda: detect_emotions("It turned out fine"), {}),
+    ('"fired" stays fired', lambda: correct_misspellings("i got fired"), "i got fired"),
+    ('"skill" is not a crisis word', lambda: correct_misspellings("a new skill", crisis_fuzzy_index), "a new skill")
+]
+
+@app.cli.command('check-analysis')
+def check_analysis_command():
+    """Run the sentiment, emotion and crisis regression cases"""
+    failures = 0
+    for description, check, expected in analysis_checks:
+        actual = check()
+        if actual != expected:
+            failures += 1
+            click.echo(f"FAIL {description}: expected {expected!r}, got {actual!r}")
+        else:
+            click.echo(f"ok   {description}")
+    if failures:
+        raise click.ClickException(f"{failures} of {len(analysis_checks)} analysis checks failed")
+    click.echo(f"All {len(analysis_checks)} analysis checks passed")
+
 # Main entry point
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -7,7 +7,7 @@ pip install -r requirements.txt
 mkdir -p nltk_data
 
 # Download NLTK data
-python -c "import nltk; nltk.download('punkt', download_dir='nltk_data'); nltk.download('stopwords', download_dir='nltk_data'); nltk.download('vader_lexicon', download_dir='nltk_data')"
+python -c "import nltk; nltk.download('punkt_tab', download_dir='nltk_data'); nltk.download('stopwords', download_dir='nltk_data'); nltk.download('vader_lexicon', download_dir='nltk_data')"
 
 echo "Setup complete! Starting Flask app..."
 